@@ -3,18 +3,145 @@ LangGraph Agent with Ollama LLM Integration
 Cortana - Level-Aware Socratic Teaching Assistant with Coding Playground
 """
 
-from typing import TypedDict, Annotated, Sequence
-from langchain_ollama import ChatOllama
+from typing import TYPE_CHECKING, AsyncIterator, TypedDict, Annotated, Sequence
+from collections import OrderedDict
+from contextlib import aclosing
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langgraph.graph import StateGraph, END
-from langgraph.graph.message import add_messages
+import asyncio
+import hashlib
 import json
-import re
+import time
 
+from backends import BackendPool
+from intents import Intent, RoutedIntent, default_router, scan
+from metrics import (
+    DEGRADED_RESPONSES, GENERATION_TIME, GENERATIONS_CANCELLED, GENERATIONS_COALESCED, GENERATIONS_IN_FLIGHT, LLM_ERRORS,
+    PROMPT_TOKENS, QUEUE_WAIT, REVIEW_LLM_CALLS_AVOIDED, REVIEW_PARSE_FALLBACKS, REVIEW_PARSE_SALVAGED, STREAMED_TOKENS, TOKENS_PER_SEC, TOKENS_SAVED, TTFT,
+    TURNS, current_trace
+)
+from curriculum import CurriculumStore, prompt_version
+from prefetch import LessonPrefetcher
+from resilience import CLOSED, OPEN, CircuitBreaker, CircuitOpen, DeadlineExceeded, PhaseDeadlines, start_deadline
+from review_cache import ReviewCache, review_key
+from review_parser import FeedbackParser, parse_feedback
+from scheduler import BACKGROUND, FairScheduler, current_flow, priority_for, set_priority
+from shared_state import SharedState
+from singleflight import SingleFlight, flight_key
+from static_review import Analysis, analyze, format_findings
+from streaming import PhaseEvent
 
-class AgentState(TypedDict):
-    """State for the conversation agent."""
-    messages: Annotated[Sequence[BaseMessage], add_messages]
+if TYPE_CHECKING:
+    # Imports NumPy; only loaded when the semantic cache is enabled
+    from semantic_cache import SemanticCache
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token, plus per-message overhead)."""
+    return len(text) // 4 + 4
+
+
+class ContextWindow:
+    """Token-budgeted prompt history with a cached rolling summary of older turns.
+    
+    Recent turns are kept verbatim. Older turns are folded into a summary that is
+    cached by a hash of the transcript prefix it covers, so it is only recomputed
+    (incrementally, from the previous summary) when the window shifts.
+    """
+    
+    # Only move the summary boundary in whole chunks so it doesn't shift every turn
+    FOLD_STEP = 4
+    
+    def __init__(self, max_cached: int = 512):
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self.max_cached = max_cached
+    
+    @staticmethod
+    def _prefix_hashes(history: list[dict]) -> list[str]:
+        """Chained hashes: entry i identifies history[:i]."""
+        hashes = [""]
+        h = hashlib.sha1()
+        for msg in history:
+            h.update(msg["role"].encode())
+            h.update(b"\x00")
+            h.update(msg["content"].encode())
+            h.update(b"\x01")
+            hashes.append(h.hexdigest())
+        return hashes
+    
+    def _cache_summary(self, key: str, summary: str):
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_cached:
+            self._summaries.popitem(last=False)
+    
+    def _split_point(self, history: list[dict], budget: int, keep_recent: int) -> int:
+        """Index before which turns are summarized instead of sent verbatim."""
+        costs = [estimate_tokens(m["content"]) for m in history]
+        if sum(costs) <= budget:
+            return 0
+        split = max(0, len(history) - keep_recent)
+        split -= split % self.FOLD_STEP
+        # Reserve room for the summary itself, then fold more if recent turns still overflow
+        remaining = budget - budget // 4
+        while split < len(history) - 1 and sum(costs[split:]) > remaining:
+            split += self.FOLD_STEP
+        return min(split, len(history) - 1)
+    
+    async def build(self, invoke, history: list[dict], level_info: dict, reserved_tokens: int) -> list[BaseMessage]:
+        """Return the history messages to send, fitting the level's context budget.
+        
+        `invoke` is an async callable taking a message list and returning the model reply.
+        """
+        if not history:
+            return []
+        budget = max(0, level_info.get("context_tokens", 2048) - reserved_tokens)
+        keep_recent = level_info.get("recent_messages", 6)
+        split = self._split_point(history, budget, keep_recent)
+        
+        recent = [
+            HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+            for m in history[split:] if m["role"] in ("user", "assistant")
+        ]
+        if split == 0:
+            return recent
+        
+        summary = await self._summary_for(invoke, history, split, budget // 4)
+        if not summary:
+            return recent
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + recent
+    
+    async def _summary_for(self, invoke, history: list[dict], split: int, max_tokens: int) -> str:
+        """Summary of history[:split], extended incrementally from the longest cached prefix."""
+        hashes = self._prefix_hashes(history[:split])
+        if hashes[split] in self._summaries:
+            self._summaries.move_to_end(hashes[split])
+            return self._summaries[hashes[split]]
+        
+        start, previous = 0, ""
+        for i in range(split - 1, 0, -1):
+            if hashes[i] in self._summaries:
+                start, previous = i, self._summaries[hashes[i]]
+                break
+        
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in history[start:split])
+        prompt = f"""Update the running summary of a tutoring conversation.
+
+Current summary:
+{previous or "(none)"}
+
+New turns:
+{transcript}
+
+Write the updated summary in at most {max(32, max_tokens * 3 // 4)} words. Keep the topic, the learner's level,
+what has been taught so far, and any open question or task. Respond with ONLY the summary."""
+        try:
+            response = await invoke([HumanMessage(content=prompt)])
+            summary = response.content.strip()
+        except Exception:
+            # Fall back to dropping older turns rather than failing the request
+            return previous
+        self._cache_summary(hashes[split], summary)
+        return summary
 
 
 class OllamaAgent:
@@ -26,31 +153,64 @@ class OllamaAgent:
             "description": "New to programming or shaky fundamentals",
             "style": "Use simple language, explain every term, provide more examples and checks",
             "hints": "many",
-            "quiz_frequency": 1
+            "quiz_frequency": 1,
+            "context_tokens": 1536,
+            "recent_messages": 6
         },
         "intermediate": {
             "name": "Intermediate", 
             "description": "Know basics but struggle with application",
             "style": "Assume basic knowledge, focus on application, fewer hints",
             "hints": "moderate",
-            "quiz_frequency": 2
+            "quiz_frequency": 2,
+            "context_tokens": 1792,
+            "recent_messages": 6
         },
         "advanced": {
             "name": "Advanced",
             "description": "Understand concepts, want guided problem solving",
             "style": "Minimal explanations, focus on edge cases and optimization, deep reasoning",
             "hints": "minimal",
-            "quiz_frequency": 3
+            "quiz_frequency": 3,
+            "context_tokens": 2048,
+            "recent_messages": 8
         }
     }
     
-    def __init__(self, model_name: str = "llama2"):
+    def __init__(self, model_name: str = "llama2", review_cache: ReviewCache = None,
+                 max_concurrent_generations: int = 4, ollama_hosts: list[str] = None,
+                 single_flight: bool = True, keep_alive: str = None, review_json_mode: bool = True,
+                 prefetch: bool = True, max_prefetch: int = None, curriculum_dir: str = None,
+                 shared_state: SharedState = None, scheduler_classes: dict = None,
+                 semantic_cache: "SemanticCache" = None, deadlines: PhaseDeadlines = None,
+                 breaker: CircuitBreaker = None):
         self.model_name = model_name
-        self.llm = ChatOllama(
-            model=model_name,
-            temperature=0.7,
-        )
-        
+        self.temperature = 0.7
+        self.review_cache = review_cache or ReviewCache()
+        # Time-to-first-token and total limits per phase, within the request's deadline
+        self.deadlines = deadlines or PhaseDeadlines()
+        # Fails calls fast while Ollama keeps erroring or stalling
+        self.breaker = breaker or CircuitBreaker()
+        # Every generation is routed to the least-loaded healthy Ollama server
+        self.backends = BackendPool(ollama_hosts, model_name, temperature=self.temperature, keep_alive=keep_alive,
+                                    read_timeout=self.deadlines.longest_wait())
+        # Identical concurrent prompts share one generation
+        self.flights = SingleFlight() if single_flight else None
+        # Model slots (per backend, shared by every worker process); cancelled calls release theirs immediately
+        self.shared_state = shared_state or SharedState()
+        self.generation_capacity = max_concurrent_generations * len(self.backends)
+        self.generation_slots = self.shared_state.slots("generations", self.generation_capacity)
+        # Decides who gets the next free slot: teaching before reviews before background work
+        self.scheduler = FairScheduler(self.generation_slots, scheduler_classes)
+        # Step-1 lessons generated while the learner answers the diagnostic (idle capacity only)
+        self.prefetch = LessonPrefetcher(
+            max_inflight=max_prefetch or len(self.backends),
+            can_start=self._has_idle_capacity
+        ) if prefetch else None
+        # Ollama's JSON mode constrains review output to valid JSON (an object, so feedback is wrapped)
+        self.review_format = "json" if review_json_mode else None
+        # Running average of completed output length per phase, to estimate tokens saved by cancels
+        self._avg_tokens: dict[str, float] = {}
         self.system_prompt = """You are Cortana, a Level-Aware Socratic Teaching Assistant.
 
 CORE RULES:
@@ -81,35 +241,78 @@ LEVEL ADAPTATION:
 - Intermediate: Assume basics, fewer hints, application focus
 - Advanced: Minimal hints, edge cases, optimization questions"""
         
-        self.graph = self._build_graph()
+        self.context = ContextWindow()
+        # Offline-generated Step-1 lessons, only used if built for this exact prompt version
+        self.curriculum = CurriculumStore(curriculum_dir, self.curriculum_version()) if curriculum_dir else None
+        # Answers to earlier first-turn questions, reused for close paraphrases at the same level
+        self.semantic_cache = semantic_cache
+        if semantic_cache is not None:
+            semantic_cache.use_version(self.curriculum_version())
+        self.router = default_router()
+        # One streaming handler per routed intent; register new phases here
+        self.phase_handlers = {
+            Intent.DIAGNOSTIC_ANSWER: self._stream_diagnostic_answer,
+            Intent.CODE_SUBMISSION: self._stream_code_submission,
+            Intent.NEW_TOPIC: self._stream_new_topic,
+            Intent.LEVEL_SELECT: self._stream_level_select,
+            Intent.TEACH: self._stream_teach,
+        }
+        # Phase payloads that don't depend on the learner's input, serialized once
+        self._static_phases: dict[tuple, tuple[dict, PhaseEvent]] = {}
+        # Only the non-streaming chat path uses the LangGraph workflow; it is compiled on first use
+        self._graph = None
+    
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
     
-    def _build_graph(self) -> StateGraph:
+    async def _agraph(self):
+        """The compiled graph, built off the event loop the first time (langgraph import + compile)."""
+        if self._graph is None:
+            await asyncio.to_thread(lambda: self.graph)
+        return self._graph
+    
+    def _build_graph(self):
         """Build the LangGraph workflow."""
+        from langchain_core.runnables import RunnableLambda
+        from langgraph.graph import StateGraph, END
+        from langgraph.graph.message import add_messages
         
-        def agent_node(state: AgentState) -> AgentState:
+        class AgentState(TypedDict):
+            """State for the conversation agent."""
+            messages: Annotated[Sequence[BaseMessage], add_messages]
+        
+        def _with_system(state: AgentState) -> list[BaseMessage]:
             messages = list(state["messages"])
             if not messages or not isinstance(messages[0], SystemMessage):
                 messages.insert(0, SystemMessage(content=self.system_prompt))
-            response = self.llm.invoke(messages)
+            return messages
+        
+        def agent_node(state: AgentState) -> AgentState:
+            with self.backends.lease() as backend:
+                response = backend.llm.invoke(_with_system(state))
+            return {"messages": [response]}
+        
+        async def aagent_node(state: AgentState, config: dict) -> AgentState:
+            level = config.get("configurable", {}).get("level")
+            response = await self._ainvoke_llm(_with_system(state), "chat", level)
             return {"messages": [response]}
         
         workflow = StateGraph(AgentState)
-        workflow.add_node("agent", agent_node)
+        # Sync and async implementations so both graph.invoke and graph.ainvoke
+        # run natively without blocking the event loop.
+        workflow.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node))
         workflow.set_entry_point("agent")
         workflow.add_edge("agent", END)
         return workflow.compile()
     
-    def _detect_educational_query(self, message: str) -> bool:
-        """Check if user is asking an educational question."""
-        keywords = ['code', 'implement', 'write', 'show me', 'give me', 'solution', 
-                   'answer', 'how to', 'how do i', 'example', 'program', 'explain',
-                   'what is', 'why', 'understand', 'learn', 'teach', 'help me']
-        return any(kw in message.lower() for kw in keywords)
-    
-    def _detect_code_submission(self, message: str) -> bool:
-        """Check if message contains code for review."""
-        code_indicators = ['```', 'def ', 'function ', 'class ', 'for ', 'while ', 'if ']
-        return any(ind in message for ind in code_indicators)
+    LEVEL_CHOICES = [
+        {"id": "beginner", "name": "Beginner", "desc": "I'm new / shaky fundamentals"},
+        {"id": "intermediate", "name": "Intermediate", "desc": "I know basics but struggle with application"},
+        {"id": "advanced", "name": "Advanced", "desc": "I understand concepts, want guided problem solving"}
+    ]
     
     def _build_level_select_json(self, topic: str) -> dict:
         """Build level selection JSON."""
@@ -117,11 +320,7 @@ LEVEL ADAPTATION:
             "phase": "LEVEL_SELECT",
             "prompt": "Before we start, how familiar are you with this topic?",
             "topic": topic,
-            "levels": [
-                {"id": "beginner", "name": "Beginner", "desc": "I'm new / shaky fundamentals"},
-                {"id": "intermediate", "name": "Intermediate", "desc": "I know basics but struggle with application"},
-                {"id": "advanced", "name": "Advanced", "desc": "I understand concepts, want guided problem solving"}
-            ],
+            "levels": self.LEVEL_CHOICES,
             "instruction": "Select your level to continue"
         }
     
@@ -201,10 +400,244 @@ LEVEL ADAPTATION:
             "instruction": "Use the playground to complete this code"
         }
     
-    def review_code(self, code: str, context: str, level: str) -> dict:
-        """Review user-submitted code and provide feedback."""
+    def _observe_call_start(self, messages: list[BaseMessage], labels: dict):
+        """Record prompt size and how long the request waited before reaching the model."""
+        trace = current_trace()
+        PROMPT_TOKENS.observe(sum(estimate_tokens(str(m.content)) for m in messages), **labels)
+        QUEUE_WAIT.observe(trace.elapsed(), **labels)
+        trace.event("llm_start", **labels)
+    
+    def _observe_completion(self, phase: str, tokens: int):
+        average = self._avg_tokens.get(phase)
+        self._avg_tokens[phase] = tokens if average is None else 0.9 * average + 0.1 * tokens
+    
+    def _observe_cancel(self, labels: dict, tokens: int):
+        """Count an aborted call and the output it would likely still have produced."""
+        GENERATIONS_CANCELLED.inc(**labels)
+        expected = self._avg_tokens.get(labels["phase"], 0.0)
+        TOKENS_SAVED.inc(max(0.0, expected - tokens), **labels)
+        current_trace().event("llm_cancelled", tokens=tokens, **labels)
+    
+    def _flight_key(self, messages: list[BaseMessage], options: dict = None) -> str:
+        return flight_key(self.model_name, self.temperature, [(m.type, m.content) for m in messages], options or {})
+    
+    def _join_flight(self, key: str, labels: dict) -> bool:
+        if self.flights.is_active(key):
+            GENERATIONS_COALESCED.inc(**labels)
+            current_trace().event("llm_coalesced", **labels)
+            return True
+        return False
+    
+    async def _ainvoke_llm(self, messages: list[BaseMessage], phase: str, level: str = None, **options):
+        """Non-streaming LLM call, shared with any identical call already in flight."""
+        if self.flights is None:
+            return await self._generate(messages, phase, level, **options)
+        key = self._flight_key(messages, options)
+        self._join_flight(key, {"phase": phase, "level": level or "none"})
+        return await self.flights.call(key, lambda: self._generate(messages, phase, level, **options))
+    
+    async def _astream_llm(self, messages: list[BaseMessage], phase: str, level: str = None, **options):
+        """Streaming LLM call; identical concurrent prompts subscribe to one generation
+        and late joiners get the chunks already emitted replayed first.
+        
+        `options` (e.g. format="json") are passed through to the Ollama request.
+        """
+        if self.flights is None:
+            stream = self._generate_stream(messages, phase, level, **options)
+        else:
+            key = self._flight_key(messages, options)
+            self._join_flight(key, {"phase": phase, "level": level or "none"})
+            stream = self.flights.stream(key, lambda: self._generate_stream(messages, phase, level, **options))
+        async for chunk in stream:
+            yield chunk
+    
+    def _has_idle_capacity(self) -> bool:
+        """Speculate only while more than half of the model slots are idle (and the model is healthy)."""
+        return (self.breaker.state == CLOSED and not self.scheduler.queued()
+                and self.generation_slots.available() > self.generation_capacity // 2)
+    
+    def _make_room(self, phase: str):
+        """Real requests never queue behind a speculative lesson."""
+        if phase != "prefetch" and self.prefetch is not None and self.generation_slots.locked():
+            if self.prefetch.preempt():
+                current_trace().event("prefetch_preempted", phase=phase)
+    
+    def _record_failure(self, error: Exception, probe: bool):
+        """Errors and timeouts from the model count against the breaker; anything else (the
+        request's own fault, its deadline, or a slot that never came) says nothing about the model."""
+        if self.backends.is_backend_error(error) or (isinstance(error, DeadlineExceeded)
+                                                     and error.stage != "queue" and not error.by_request):
+            self.breaker.record_failure(f"{type(error).__name__}: {error}")
+        elif probe:
+            self.breaker.abandon()
+    
+    async def _generate(self, messages: list[BaseMessage], phase: str, level: str = None, **options):
+        """Instrumented non-streaming LLM call; returns the model's message.
+        
+        Raises CircuitOpen without calling the model while the breaker is open, and
+        DeadlineExceeded if the phase's (or the request's) deadline passes first.
+        """
+        labels = {"phase": phase, "level": level or "none"}
+        probe = self.breaker.allow(phase)
+        deadline = self.deadlines.start(phase)
+        self._make_room(phase)
+        queued = True
+        try:
+            async with self.scheduler.slot(priority_for(phase), current_flow(), timeout=deadline.until_first_token()):
+                queued = False
+                self._observe_call_start(messages, labels)
+                GENERATIONS_IN_FLIGHT.inc()
+                start = time.perf_counter()
+                tried = []
+                try:
+                    while True:
+                        try:
+                            with self.backends.lease(exclude=tuple(tried)) as backend:
+                                limit = asyncio.timeout(deadline.until_done())
+                                try:
+                                    async with limit:
+                                        response = await backend.llm.ainvoke(messages, **options)
+                                except TimeoutError:
+                                    if not limit.expired():
+                                        raise
+                                    raise deadline.exceeded("generation") from None
+                            break
+                        except Exception as e:
+                            # A dead backend shouldn't fail the request while others are up
+                            tried.append(backend)
+                            if not self.backends.is_backend_error(e) or len(tried) >= len(self.backends):
+                                raise
+                except asyncio.CancelledError:
+                    self._observe_cancel(labels, 0)
+                    raise
+                except Exception:
+                    LLM_ERRORS.inc(**labels)
+                    raise
+                finally:
+                    GENERATIONS_IN_FLIGHT.dec()
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.abandon()
+            raise
+        except Exception as e:
+            if queued and isinstance(e, TimeoutError):
+                error = deadline.exceeded("queue")
+                self._record_failure(error, probe)
+                raise error from None
+            self._record_failure(e, probe)
+            raise
+        self.breaker.record_success()
+        GENERATION_TIME.observe(time.perf_counter() - start, **labels)
+        self._observe_completion(phase, estimate_tokens(str(response.content)))
+        current_trace().event("llm_done", **labels)
+        return response
+    
+    async def _generate_stream(self, messages: list[BaseMessage], phase: str, level: str = None, **options):
+        """Instrumented streaming LLM call; yields non-empty content chunks.
+        
+        Closing or cancelling the consumer aborts the model call and frees its slot. The first
+        chunk must arrive before the phase's time-to-first-token deadline and the last before
+        its total deadline (DeadlineExceeded otherwise); CircuitOpen is raised without
+        calling the model while the breaker is open.
+        """
+        labels = {"phase": phase, "level": level or "none"}
+        probe = self.breaker.allow(phase)
+        deadline = self.deadlines.start(phase)
+        self._make_room(phase)
+        queued = True
+        tokens = 0
+        timely = True
+        try:
+            async with self.scheduler.slot(priority_for(phase), current_flow(), timeout=deadline.until_first_token()):
+                queued = False
+                self._observe_call_start(messages, labels)
+                GENERATIONS_IN_FLIGHT.inc()
+                trace = current_trace()
+                start = time.perf_counter()
+                first_token = None
+                tried = []
+                try:
+                    while True:
+                        try:
+                            with self.backends.lease(exclude=tuple(tried)) as backend:
+                                trace.event("backend", url=backend.url)
+                                async with aclosing(backend.llm.astream(messages, **options)) as stream:
+                                    while True:
+                                        # Only the wait for the model is timed, never the consumer
+                                        limit = asyncio.timeout(deadline.until_first_token() if first_token is None
+                                                                else deadline.until_done())
+                                        try:
+                                            async with limit:
+                                                chunk = await anext(stream)
+                                        except StopAsyncIteration:
+                                            break
+                                        except TimeoutError:
+                                            if not limit.expired():
+                                                raise
+                                            raise deadline.exceeded("first_token" if first_token is None else "generation") from None
+                                        if chunk.content:
+                                            if first_token is None:
+                                                first_token = time.perf_counter()
+                                                TTFT.observe(first_token - start, **labels)
+                                                trace.event("first_token", **labels)
+                                                # A slow model is known by its first token; a healthy one only at the end
+                                                timely = self.breaker.record_first_token(first_token - start)
+                                                probe = False
+                                            tokens += 1
+                                            yield chunk.content
+                            break
+                        except Exception as e:
+                            # Retry elsewhere only if nothing has been streamed yet
+                            tried.append(backend)
+                            if tokens or not self.backends.is_backend_error(e) or len(tried) >= len(self.backends):
+                                raise
+                except (asyncio.CancelledError, GeneratorExit):
+                    self._observe_cancel(labels, tokens)
+                    raise
+                except Exception:
+                    LLM_ERRORS.inc(**labels)
+                    raise
+                finally:
+                    GENERATIONS_IN_FLIGHT.dec()
+                    STREAMED_TOKENS.inc(tokens, **labels)
+        except (asyncio.CancelledError, GeneratorExit):
+            if probe:
+                self.breaker.abandon()
+            raise
+        except Exception as e:
+            if queued and isinstance(e, TimeoutError):
+                error = deadline.exceeded("queue")
+                self._record_failure(error, probe)
+                raise error from None
+            self._record_failure(e, probe)
+            raise
+        if timely:
+            self.breaker.record_success()
+        elapsed = time.perf_counter() - start
+        GENERATION_TIME.observe(elapsed, **labels)
+        if first_token is not None and tokens > 1 and time.perf_counter() > first_token:
+            TOKENS_PER_SEC.observe(tokens / (time.perf_counter() - first_token), **labels)
+        self._observe_completion(phase, tokens)
+        trace.event("llm_done", tokens=tokens, **labels)
+    
+    def _build_review_messages(self, code: str, context: str, level: str, findings: list[dict] = None) -> list[BaseMessage]:
+        """Build the prompt messages for a code review."""
         level_info = self.LEVELS.get(level, self.LEVELS["beginner"])
         
+        # Static findings are already in the review; the model should build on them, not repeat them
+        static_notes = ""
+        if findings:
+            static_notes = f"""
+A static check already found these issues (line numbers are exact). Do not repeat them:
+{format_findings(findings)}
+"""
+        
+        # In JSON mode Ollama only emits objects, so the array travels inside {"feedback": [...]}
+        if self.review_format == "json":
+            shape, answer = 'a JSON object {"feedback": [...]} whose JSON array holds objects', "JSON object"
+        else:
+            shape, answer = "a JSON array with objects", "JSON array"
+        
         # Build review prompt
         review_prompt = f"""Review this code submitted by a {level_info['name']} level student.
 Context: {context}
@@ -213,8 +646,8 @@ Code:
 ```
 {code}
 ```
-
-Provide feedback as a JSON array with objects containing:
+{static_notes}
+Provide feedback as {shape} containing:
 - "type": "hint" | "error" | "improvement" | "question"
 - "message": the feedback message
 - "line": (optional) line number if applicable
@@ -225,29 +658,183 @@ Remember:
 - Ask questions that guide them to the fix
 - Adapt feedback complexity to {level_info['name']} level
 
-Respond with ONLY the JSON array, no other text."""
+Respond with ONLY the {answer}, no other text."""
 
-        messages = [
+        return [
             SystemMessage(content=self.system_prompt),
             HumanMessage(content=review_prompt)
         ]
+    
+    FALLBACK_FEEDBACK = [
+        {"type": "hint", "message": "Take a closer look at your logic. What happens in edge cases?"},
+        {"type": "question", "message": "Can you trace through your code with a simple example?"}
+    ]
+    
+    def _review_outcome(self, complete: bool, model_items: int, level: str) -> str:
+        """Classify a model review: "complete", "partial" (salvaged items) or "fallback"."""
+        if complete:
+            return "complete"
+        if model_items:
+            REVIEW_PARSE_SALVAGED.inc(level=level or "none")
+            current_trace().event("review_parse_salvaged", items=model_items, level=level)
+            return "partial"
+        REVIEW_PARSE_FALLBACKS.inc(level=level or "none")
+        current_trace().event("review_parse_fallback", level=level)
+        return "fallback"
+    
+    @staticmethod
+    def _without_static(items: list[dict], findings: list[dict]) -> list[dict]:
+        """Drop model items that repeat a static finding (same type and line)."""
+        flagged = {(f["type"], f.get("line")) for f in findings}
+        return [item for item in items if (item["type"], item.get("line")) not in flagged]
+    
+    def _parse_review_response(self, content: str, findings: list[dict] = None, level: str = None) -> tuple[dict, str]:
+        """Parse a whole model review into a CODE_REVIEW payload.
+        
+        Static `findings` lead the feedback. Returns the payload and the outcome
+        ("complete", "partial" or "fallback").
+        """
+        findings = findings or []
+        items, complete = parse_feedback(content)
+        outcome = self._review_outcome(complete, len(items), level)
+        feedback = findings + self._without_static(items, findings)
+        if outcome == "fallback":
+            feedback += self.FALLBACK_FEEDBACK
+        return self._build_code_review_json(feedback), outcome
+    
+    def _static_prepass(self, code: str, level: str) -> tuple[Analysis, dict]:
+        """Analyze Python submissions locally; hard errors get their review without the model."""
+        analysis = analyze(code)
+        if not analysis.hard_error:
+            return analysis, None
+        REVIEW_LLM_CALLS_AVOIDED.inc(reason="syntax_error")
+        current_trace().event("review_static_short_circuit", line=analysis.findings[0]["line"], level=level)
+        return analysis, self._build_code_review_json(analysis.findings)
+    
+    def review_code(self, code: str, context: str, level: str, use_cache: bool = True) -> dict:
+        """Review user-submitted code and provide feedback (sync-compat shim)."""
+        key = review_key(code, context, level)
+        if use_cache:
+            cached = self.review_cache.get(key)
+            if cached is not None:
+                return cached
+        analysis, review = self._static_prepass(code, level)
+        if review is not None:
+            self.review_cache.put(key, review)
+            return review
+        if self.breaker.state == OPEN:
+            DEGRADED_RESPONSES.inc(kind="review", reason="circuit_open")
+            return self._build_code_review_json(analysis.findings + self.FALLBACK_FEEDBACK)
+        with self.backends.lease() as backend:
+            response = backend.llm.invoke(
+                self._build_review_messages(code, context, level, analysis.findings),
+                format=self.review_format
+            )
+        review, outcome = self._parse_review_response(response.content, analysis.findings, level)
+        if outcome == "complete":
+            self.review_cache.put(key, review)
+        return review
+    
+    async def astream_review(self, code: str, context: str, level: str, use_cache: bool = True) -> AsyncIterator[dict]:
+        """Yield review feedback items as soon as each one is known.
         
-        response = self.llm.invoke(messages)
+        Cached and statically short-circuited reviews are replayed at once; model items arrive
+        as each JSON object closes. Only a review whose JSON array completed is cached, so a
+        salvaged or canned review can still be retried. A model that is down or out of time
+        degrades the review to whatever was salvaged (or canned hints) instead of failing it.
+        """
+        key = review_key(code, context, level)
+        cached = self.review_cache.get(key) if use_cache else None
+        if cached is not None:
+            for item in cached["feedback"]:
+                yield item
+            return
+        analysis, review = self._static_prepass(code, level)
+        if review is not None:
+            self.review_cache.put(key, review)
+            for item in review["feedback"]:
+                yield item
+            return
         
-        # Parse response
+        feedback = list(analysis.findings)
+        for item in feedback:
+            yield item
+        parser = FeedbackParser()
+        messages = self._build_review_messages(code, context, level, analysis.findings)
+        degraded = None
         try:
-            feedback = json.loads(response.content)
-        except:
-            # Fallback feedback
-            feedback = [
-                {"type": "hint", "message": "Take a closer look at your logic. What happens in edge cases?"},
-                {"type": "question", "message": "Can you trace through your code with a simple example?"}
-            ]
+            async for chunk in self._astream_llm(messages, "review", level, format=self.review_format):
+                for item in self._without_static(parser.feed(chunk), analysis.findings):
+                    feedback.append(item)
+                    yield item
+        except (CircuitOpen, DeadlineExceeded) as e:
+            degraded = "circuit_open" if isinstance(e, CircuitOpen) else "deadline"
+            DEGRADED_RESPONSES.inc(kind="review", reason=degraded)
+            current_trace().event("review_degraded", reason=degraded, level=level)
+        for item in self._without_static(parser.finish(), analysis.findings):
+            feedback.append(item)
+            yield item
         
+        if degraded is not None:
+            # Never cached: the model may well finish the review next time
+            if not parser.items:
+                for item in self.FALLBACK_FEEDBACK:
+                    feedback.append(item)
+                    yield item
+            return
+        outcome = self._review_outcome(parser.complete, parser.items, level)
+        if outcome == "fallback":
+            for item in self.FALLBACK_FEEDBACK:
+                feedback.append(item)
+                yield item
+        elif outcome == "complete":
+            self.review_cache.put(key, self._build_code_review_json(feedback))
+    
+    async def areview_code(self, code: str, context: str, level: str, use_cache: bool = True) -> dict:
+        """Review user-submitted code without blocking the event loop."""
+        feedback = [item async for item in self.astream_review(code, context, level, use_cache)]
         return self._build_code_review_json(feedback)
     
-    def chat(self, message: str, history: list[dict] = None) -> str:
-        """Send a message and get a response."""
+    async def areview_batch(self, items: list[dict], concurrency: int = 4) -> AsyncIterator[dict]:
+        """Review many submissions with bounded parallelism, yielding each result as it completes.
+        
+        Items are dicts with `code`, `context`, `level` and optional `use_cache`. Results carry the
+        item's `index`, `ok`, either `review` or `error`, and `queued_ms`/`elapsed_ms`; one failing
+        item never aborts the rest.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        submitted = time.perf_counter()
+        
+        async def review_one(index: int, item: dict) -> dict:
+            # Bulk work: behind interactive turns and single reviews, and never refused
+            set_priority(BACKGROUND)
+            # Each item is bounded by the review limits, not by the whole batch's request
+            start_deadline(None)
+            async with semaphore:
+                start = time.perf_counter()
+                result = {"index": index, "queued_ms": round((start - submitted) * 1000, 1)}
+                try:
+                    result["review"] = await self.areview_code(
+                        item["code"], item.get("context"), item.get("level"), item.get("use_cache", True)
+                    )
+                    result["ok"] = True
+                except Exception as e:
+                    result["ok"] = False
+                    result["error"] = f"{type(e).__name__}: {e}"
+                result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                return result
+        
+        tasks = [asyncio.create_task(review_one(i, item)) for i, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away (or the consumer stopped early): drop the remaining reviews
+            for task in tasks:
+                task.cancel()
+    
+    def _history_to_messages(self, history: list[dict] = None) -> list[BaseMessage]:
+        """Convert role/content dicts into LangChain messages."""
         messages = []
         if history:
             for msg in history:
@@ -255,20 +842,52 @@ Respond with ONLY the JSON array, no other text."""
                     messages.append(HumanMessage(content=msg["content"]))
                 elif msg["role"] == "assistant":
                     messages.append(AIMessage(content=msg["content"]))
-        messages.append(HumanMessage(content=message))
-        result = self.graph.invoke({"messages": messages})
+        return messages
+    
+    def _static_phase(self, key: tuple, build) -> tuple[dict, PhaseEvent]:
+        """Payload and event for a phase that is the same for every learner (built on first use)."""
+        cached = self._static_phases.get(key)
+        if cached is None:
+            payload = build()
+            cached = self._static_phases[key] = (payload, PhaseEvent.of(payload))
+        return cached
+    
+    def _level_select_event(self, topic: str) -> PhaseEvent:
+        """LEVEL_SELECT for a topic: only the topic is serialized per turn."""
+        _, template = self._static_phase(("LEVEL_SELECT",), lambda: self._build_level_select_json(None))
+        return PhaseEvent(template.phase, template.data.replace('"topic":null', f'"topic":{json.dumps(topic)}', 1))
+    
+    def _final_content(self, result: dict) -> str:
+        """Extract the reply text from a graph result."""
         if result["messages"]:
             return result["messages"][-1].content
         return "I couldn't generate a response. Please try again."
     
-    def evaluate_text_diagnostic(self, message: str) -> dict:
-        """Evaluate text-based diagnostic answers (D1: A, D2: B)."""
-        # Extract answers
-        answers = re.findall(r'[Dd]\d\s*:\s*([ABCabc])', message)
-        
-        if not answers:
-            return None
-        
+    def chat(self, message: str, history: list[dict] = None) -> str:
+        """Send a message and get a response (sync-compat shim)."""
+        messages = self._history_to_messages(history)
+        messages.append(HumanMessage(content=message))
+        return self._final_content(self.graph.invoke({"messages": messages}))
+    
+    async def _build_prompt(self, history: list[dict], level: str, content: str) -> list[BaseMessage]:
+        """System prompt + budgeted history + the new user turn."""
+        level_info = self.LEVELS.get(level or "beginner", self.LEVELS["beginner"])
+        reserved = estimate_tokens(self.system_prompt) + estimate_tokens(content)
+        messages = [SystemMessage(content=self.system_prompt)]
+        summarize = lambda msgs: self._ainvoke_llm(msgs, "summary", level)
+        messages.extend(await self.context.build(summarize, history, level_info, reserved))
+        messages.append(HumanMessage(content=content))
+        return messages
+    
+    async def achat(self, message: str, history: list[dict] = None, user_level: str = None) -> str:
+        """Send a message and get a response without blocking the event loop."""
+        messages = await self._build_prompt(history, user_level, message)
+        graph = await self._agraph()
+        result = await graph.ainvoke({"messages": messages}, config={"configurable": {"level": user_level}})
+        return self._final_content(result)
+    
+    def _score_diagnostic(self, answers: list[str]) -> dict:
+        """Map diagnostic answers (A/B/C) to a TEXT_DIAGNOSTIC_RESULT."""
         # Count frequencies
         counts = {'A': 0, 'B': 0, 'C': 0}
         for ans in answers:
@@ -297,45 +916,136 @@ Respond with ONLY the JSON array, no other text."""
             "level": level,
             "message": f"Based on your answers, I've set the teaching level to **{level_info['name']}**.\n\n{level_info['description']}.\n\nLet's start learning step-by-step."
         }
+    
+    def evaluate_text_diagnostic(self, message: str) -> dict:
+        """Evaluate text-based diagnostic answers (D1: A, D2: B)."""
+        answers = scan(message).answers
+        if not answers:
+            return None
+        return self._score_diagnostic(answers)
 
-    async def chat_stream(self, message: str, history: list[dict] = None, user_level: str = None):
-        """Stream a response with level-aware structured output."""
-        messages = [SystemMessage(content=self.system_prompt)]
+    async def admit_turn(self, message: str, history: list[dict] = None, user_level: str = None) -> RoutedIntent:
+        """Route a turn before any response is sent. Turns that will call the model are refused
+        (Overloaded) when its queue is too long, and turns that will teach from it (CircuitOpen)
+        while it is failing; level pickers, diagnostics and already-known answers never are.
+        Reviews degrade instead of being refused."""
+        routed = self.router.route(message, not history)
+        phase = await self._model_phase(routed, message, history, user_level)
+        if phase is not None:
+            self.scheduler.admit(priority_for(phase))
+        if phase in ("teach", "lesson"):
+            self.breaker.check(phase)
+        return routed
+    
+    async def _model_phase(self, routed: RoutedIntent, message: str, history: list[dict], user_level: str) -> str:
+        """The phase of the model call a routed turn will make, or None if it is answered without one."""
+        if routed.intent == Intent.TEACH:
+            if not history and self.semantic_cache is not None:
+                if (await self.semantic_cache.lookup("teach", message, user_level, peek=True)).answer is not None:
+                    return None
+            return "teach"
+        if routed.intent == Intent.DIAGNOSTIC_ANSWER:
+            level = self._score_diagnostic(routed.answers)["level"]
+            topic = self._topic_from_history(history)
+            if topic and self.curriculum is not None and self.curriculum.has(topic, level):
+                return None
+            if topic and self.prefetch is not None and self.prefetch.has(topic, level):
+                return None
+            if topic and self.semantic_cache is not None:
+                if (await self.semantic_cache.lookup("lesson", topic, level, peek=True)).answer is not None:
+                    return None
+            return "lesson"
+        if routed.intent == Intent.CODE_SUBMISSION:
+            level = user_level or "beginner"
+            if review_key(routed.code, "User submitted code for review", level) in self.review_cache:
+                return None
+            # Code that doesn't parse is reviewed without the model
+            return None if analyze(routed.code).hard_error else "review"
+        return None
+    
+    async def chat_stream(self, message: str, history: list[dict] = None, user_level: str = None,
+                          routed: RoutedIntent = None):
+        """Stream a response: text chunks, with structured payloads (level picker, diagnostic,
+        review card) as PhaseEvents between them. `routed` is the turn's admit_turn result."""
+        is_new = not history or len(history) == 0
+        routed = routed or self.router.route(message, is_new)
+        TURNS.inc(phase=routed.intent.value.lower(), level=user_level or "none")
+        current_trace().event("routed", intent=routed.intent.value)
+        handler = self.phase_handlers[routed.intent]
+        async for chunk in handler(routed, message, history, user_level):
+            yield chunk
+    
+    async def _stream_diagnostic_answer(self, routed: RoutedIntent, message: str, history: list[dict], user_level: str):
+        """Handle text-based diagnostic (D1: A, D2: B), then start teaching."""
+        scored = self._score_diagnostic(routed.answers)
+        text_diag, event = self._static_phase(("TEXT_DIAGNOSTIC_RESULT", scored["level"]), lambda: scored)
+        yield event
+        yield text_diag["message"]
         
-        if history:
-            for msg in history:
-                if msg["role"] == "user":
-                    messages.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    messages.append(AIMessage(content=msg["content"]))
+        # Continue to teaching immediately
+        user_level = text_diag["level"]
+        topic = self._topic_from_history(history)
         
-        is_new = not history or len(history) == 0
-        is_educational = self._detect_educational_query(message)
-        has_code = self._detect_code_submission(message)
-        
-        # Handle text-based diagnostic (D1: A, D2: B)
-        text_diag = self.evaluate_text_diagnostic(message)
-        if text_diag:
-            yield "<!--JSON_START-->\n"
-            yield json.dumps(text_diag, indent=2)
-            yield "\n<!--JSON_END-->\n\n"
-            yield text_diag["message"]
-            
-            # Continue to teaching immediately
-            user_level = text_diag["level"]
-            level_info = self.LEVELS[user_level]
-            
-            # Inject a prompt to force teaching start
-            # Try to find topic from history
-            topic_context = "current topic"
-            if history:
-                # Naive attempt to find the first user message which usually contains the question
-                for msg in history:
-                    if msg["role"] == "user":
-                        topic_context = msg["content"]
-                        break
-            
-            force_prompt = f"""The user has completed the diagnostic assessment. 
+        # Popular topics are served from the precomputed curriculum
+        entry = self.curriculum.get(topic, user_level) if self.curriculum is not None and topic else None
+        if entry is not None:
+            current_trace().event("curriculum_hit", level=user_level)
+            yield entry["lesson"]
+            if entry.get("quiz"):
+                yield self._render_quiz(entry["quiz"])
+            return
+        
+        # The lesson may already be (partly) generated if the learner confirmed the level they picked
+        lesson = self.prefetch.take(topic, user_level) if self.prefetch is not None and topic else None
+        if lesson is not None:
+            current_trace().event("prefetch_hit", level=user_level)
+        
+        async def generate():
+            # Replace the "D1: ..." message with our directive for the LLM
+            messages = await self._build_prompt(history, user_level, self._lesson_prompt(topic or "current topic", user_level))
+            async for chunk in self._astream_llm(messages, "lesson", user_level):
+                yield chunk
+        
+        # Prefetched lessons seed the semantic cache like generated ones
+        async for chunk in self._cached_stream("lesson", topic, user_level, lesson or generate()):
+            yield chunk
+    
+    async def _cached_stream(self, kind: str, question: str, level: str, generate: AsyncIterator[str]):
+        """The semantic cache's answer to `question` if it has one; otherwise `generate` (not
+        started until then), whose complete output then seeds the cache."""
+        if self.semantic_cache is None or not question:
+            async for chunk in generate:
+                yield chunk
+            return
+        probe = await self.semantic_cache.lookup(kind, question, level)
+        if probe.answer is not None:
+            await generate.aclose()
+            yield probe.answer
+            return
+        parts = []
+        try:
+            async for chunk in generate:
+                parts.append(chunk)
+                yield chunk
+        except Exception:
+            # A failed source (a prefetched lesson included) raises; its partial answer is never reused
+            current_trace().event("semantic_cache_not_stored", kind=kind, level=level)
+            raise
+        # Only reached when the source finished (not cancelled, failed or cut off)
+        self.semantic_cache.store(probe, "".join(parts))
+    
+    @staticmethod
+    def _topic_from_history(history: list[dict]) -> str:
+        """The first user message, which usually holds the learner's question (None if absent)."""
+        for msg in history or []:
+            if msg["role"] == "user":
+                return msg["content"]
+        return None
+    
+    def _lesson_prompt(self, topic_context: str, user_level: str) -> str:
+        """Directive that makes the model start teaching Step 1 after the diagnostic."""
+        level_info = self.LEVELS[user_level]
+        return f"""The user has completed the diagnostic assessment. 
 detected_level: {user_level} ({level_info['name']})
 topic_request: {topic_context}
 
@@ -348,81 +1058,129 @@ INSTRUCTION: Start teaching {topic_context} step-by-step for a {level_info['name
 
 GENERATE THE LESSON CONTENT NOW.
 """
-            # Replace the "D1: ..." message with our directive for the LLM
-            messages.append(HumanMessage(content=force_prompt))
-            async for chunk in self.llm.astream(messages):
-                if chunk.content:
-                    yield chunk.content
-            return
-
-        # Handle code submission
-        elif has_code:
-            yield "<!--JSON_START-->\n"
-            # Extract code from message
-            code_match = re.search(r'```[\w]*\n?([\s\S]*?)```', message)
-            code = code_match.group(1) if code_match else message
-            review = self.review_code(code, "User submitted code for review", user_level or "beginner")
-            yield json.dumps(review, indent=2)
-            yield "\n<!--JSON_END-->\n\n"
-            yield "**[CODE REVIEW]** Let me review your code...\n\n"
-            for fb in review.get("feedback", []):
-                fb_type = fb.get("type", "hint").upper()
-                yield f"**{fb_type}:** {fb.get('message', '')}\n\n"
-            return
-        
-        # New educational query - start with level selection
-        elif is_new and is_educational:
-            topic = message.lower().replace("how do i ", "").replace("implement ", "").replace("?", "").strip()
-            
-            yield "<!--JSON_START-->\n"
-            level_data = self._build_level_select_json(topic)
-            yield json.dumps(level_data, indent=2)
-            yield "\n<!--JSON_END-->\n\n"
-            
-            yield "Before we start, **how familiar are you with this topic?**\n\n"
-            for lvl in level_data["levels"]:
-                yield f"**{lvl['name']}** - {lvl['desc']}\n\n"
-            yield "\nSelect your level to continue, then I'll guide you step by step.\n"
-            return
+    
+    QUIZ_PROMPT = """Write one multiple-choice question that checks understanding of Step 1 of {topic} for a {level} learner.
+Respond with ONLY a JSON object: {{"question": "...", "options": ["...", "...", "...", "..."], "answer": <index of the correct option>}}"""
+    
+    def curriculum_version(self) -> str:
+        """Changes whenever anything that shapes a precomputed lesson changes."""
+        return prompt_version(self.model_name, self.system_prompt, self._lesson_prompt("{topic}", "beginner"), self.QUIZ_PROMPT)
+    
+    async def generate_curriculum_entry(self, topic: str, level: str) -> dict:
+        """Step-1 lesson and a quiz for the offline curriculum build."""
+        messages = await self._build_prompt(None, level, self._lesson_prompt(topic, level))
+        lesson = await self._ainvoke_llm(messages, "curriculum", level)
+        quiz_messages = [
+            SystemMessage(content=self.system_prompt),
+            HumanMessage(content=self.QUIZ_PROMPT.format(topic=topic, level=self.LEVELS[level]["name"]))
+        ]
+        quiz = None
+        try:
+            raw = json.loads((await self._ainvoke_llm(quiz_messages, "curriculum", level, format="json")).content)
+            if isinstance(raw.get("question"), str) and isinstance(raw.get("options"), list) and len(raw["options"]) >= 2:
+                quiz = self._build_quiz_json(raw["question"], [str(o) for o in raw["options"]], level)
+                if isinstance(raw.get("answer"), int) and 0 <= raw["answer"] < len(raw["options"]):
+                    quiz["answer"] = raw["answer"]
+        except (ValueError, AttributeError):
+            pass
+        return {"lesson": lesson.content, "quiz": quiz}
+    
+    def _render_quiz(self, quiz: dict) -> str:
+        """Quiz as chat text (the answer index stays server-side)."""
+        lines = [f"\n\n**Quick check:** {quiz['question']}\n"]
+        for i, option in enumerate(quiz["options"]):
+            lines.append(f"   {chr(65 + i)}) {option}\n")
+        return "".join(lines)
+    
+    async def _speculative_lesson(self, history: list[dict], topic: str, level: str):
+        """Step-1 lesson generated ahead of the diagnostic answer."""
+        messages = await self._build_prompt(history, level, self._lesson_prompt(topic, level))
+        async for chunk in self._astream_llm(messages, "prefetch", level):
+            yield chunk
+    
+    async def _stream_code_submission(self, routed: RoutedIntent, message: str, history: list[dict], user_level: str):
+        """Review code pasted into the chat, streaming each feedback item as the model closes it."""
+        yield "**[CODE REVIEW]** Let me review your code...\n\n"
+        feedback = []
+        async for fb in self.astream_review(routed.code, "User submitted code for review", user_level or "beginner"):
+            feedback.append(fb)
+            yield f"**{fb['type'].upper()}:** {fb['message']}\n\n"
+        # The structured card follows once the review is complete
+        yield PhaseEvent.of(self._build_code_review_json(feedback))
+    
+    async def _stream_new_topic(self, routed: RoutedIntent, message: str, history: list[dict], user_level: str):
+        """New educational query - start with level selection."""
+        yield self._level_select_event(routed.topic)
         
-        # Check if user selected a level
-        level_keywords = ["beginner", "intermediate", "advanced"]
-        selected_level = None
-        for kw in level_keywords:
-            if kw in message.lower() and not text_diag: # Avoid re-triggering if diagnosed
-                selected_level = kw
-                break
+        yield "Before we start, **how familiar are you with this topic?**\n\n"
+        for lvl in self.LEVEL_CHOICES:
+            yield f"**{lvl['name']}** - {lvl['desc']}\n\n"
+        yield "\nSelect your level to continue, then I'll guide you step by step.\n"
+    
+    async def _stream_level_select(self, routed: RoutedIntent, message: str, history: list[dict], user_level: str):
+        """User selected level - show diagnostic."""
+        level_info = self.LEVELS[routed.level]
         
-        if selected_level and not text_diag:
-            # User selected level - show diagnostic
-            level_info = self.LEVELS[selected_level]
-            yield "<!--JSON_START-->\n"
-            diag = self._build_diagnostic_json("this topic", selected_level)
-            yield json.dumps(diag, indent=2)
-            yield "\n<!--JSON_END-->\n\n"
-            
-            yield f"**Level set to: {level_info['name']}**\n\n"
-            yield "Let me verify with a quick check:\n\n"
-            for i, q in enumerate(diag["questions"], 1):
-                yield f"**Q{i}:** {q['text']}\n"
-                for opt in q["options"]:
-                    yield f"   {opt['key']}) {opt['text']}\n"
-                yield "\n"
-            return
+        # Most learners confirm the level they picked: start their lesson while they answer
+        topic = self._topic_from_history(history)
+        precomputed = self.curriculum is not None and topic and self.curriculum.has(topic, routed.level)
+        if self.prefetch is not None and topic and not precomputed and self.semantic_cache is not None:
+            precomputed = (await self.semantic_cache.lookup("lesson", topic, routed.level, peek=True)).answer is not None
+        if self.prefetch is not None and topic and not precomputed:
+            self.prefetch.speculate(
+                topic, routed.level,
+                lambda: self._speculative_lesson(list(history) + [{"role": "user", "content": message}], topic, routed.level)
+            )
+        diag, event = self._static_phase(("DIAGNOSTIC", routed.level),
+                                         lambda: self._build_diagnostic_json("this topic", routed.level))
+        yield event
         
-        # Regular teaching flow - use LLM
+        yield f"**Level set to: {level_info['name']}**\n\n"
+        yield "Let me verify with a quick check:\n\n"
+        for i, q in enumerate(diag["questions"], 1):
+            yield f"**Q{i}:** {q['text']}\n"
+            for opt in q["options"]:
+                yield f"   {opt['key']}) {opt['text']}\n"
+            yield "\n"
+    
+    async def _stream_teach(self, routed: RoutedIntent, message: str, history: list[dict], user_level: str):
+        """Regular teaching flow - use LLM."""
         level_context = ""
         if user_level:
             level_info = self.LEVELS.get(user_level, self.LEVELS["beginner"])
             level_context = f"\n\nAdapt your response for a {level_info['name']} level student. {level_info['style']}"
         
-        messages.append(HumanMessage(content=message + level_context))
+        async def generate():
+            messages = await self._build_prompt(history, user_level, message + level_context)
+            async for chunk in self._astream_llm(messages, "teach", user_level):
+                yield chunk
         
-        async for chunk in self.llm.astream(messages):
-            if chunk.content:
-                yield chunk.content
+        # Only first turns are cached: later answers depend on the conversation so far
+        async for chunk in self._cached_stream("teach", message if not history else None, user_level, generate()):
+            yield chunk
 
 
-def create_agent(model_name: str = "phi") -> OllamaAgent:
+def create_agent(model_name: str = "phi", review_cache: ReviewCache = None,
+                 max_concurrent_generations: int = 4, ollama_hosts: list[str] = None,
+                 single_flight: bool = True, keep_alive: str = None,
+                 review_json_mode: bool = True, prefetch: bool = True,
+                 curriculum_dir: str = None, shared_state: SharedState = None,
+                 scheduler_classes: dict = None, semantic_cache: "SemanticCache" = None,
+                 deadlines: PhaseDeadlines = None, breaker: CircuitBreaker = None) -> OllamaAgent:
     """Create an Ollama agent with the specified model."""
-    return OllamaAgent(model_name=model_name)
+    return OllamaAgent(
+        model_name=model_name,
+        review_cache=review_cache,
+        max_concurrent_generations=max_concurrent_generations,
+        ollama_hosts=ollama_hosts,
+        single_flight=single_flight,
+        keep_alive=keep_alive,
+        review_json_mode=review_json_mode,
+        prefetch=prefetch,
+        curriculum_dir=curriculum_dir,
+        shared_state=shared_state,
+        scheduler_classes=scheduler_classes,
+        semantic_cache=semantic_cache,
+        deadlines=deadlines,
+        breaker=breaker
+    )
@@ -0,0 +1,187 @@
+"""
+Pool of Ollama backends for Cortana
+Routes each generation to the healthy backend with the fewest outstanding requests,
+ejecting failing backends and re-admitting them once background health checks pass.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from resilience import DeadlineExceeded
+
+
+logger = logging.getLogger("cortana.backends")
+
+
+def normalize_host(host: Optional[str]) -> str:
+    """Resolve a backend address the way the Ollama client does (OLLAMA_HOST, default port)."""
+    host = (host or os.getenv("OLLAMA_HOST") or "127.0.0.1:11434").strip().rstrip("/")
+    if "://" not in host:
+        host = "http://" + host
+    parts = urlsplit(host)
+    netloc = parts.netloc if parts.port else f"{parts.hostname}:11434"
+    return f"{parts.scheme}://{netloc}{parts.path}"
+
+
+class Backend:
+    """One Ollama server and its load/health bookkeeping.
+
+    The LangChain client is created on first use: importing langchain_ollama costs about
+    half a second, which would otherwise be paid by every worker before it can serve.
+    """
+
+    def __init__(self, url: str, llm_options: dict):
+        self.url = url
+        self.llm_options = llm_options
+        self._llm = None
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self.check_latency: Optional[float] = None
+        self.served = 0
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_ollama import ChatOllama
+            self._llm = ChatOllama(base_url=self.url, **self.llm_options)
+        return self._llm
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "check_latency_ms": round(self.check_latency * 1000, 1) if self.check_latency is not None else None,
+        }
+
+
+class BackendPool:
+    """Least-outstanding-requests routing over one or more Ollama servers."""
+
+    def __init__(self, urls: list[str], model_name: str, temperature: float = 0.7,
+                 failure_threshold: int = 3, check_interval: float = 10.0, check_timeout: float = 2.0,
+                 keep_alive: Optional[str] = None, read_timeout: Optional[float] = None):
+        urls = [normalize_host(u) for u in (urls or [None])]
+        # keep_alive rides on every request so real traffic also keeps the model resident
+        options = {"model": model_name, "temperature": temperature, "keep_alive": keep_alive}
+        if read_timeout:
+            # Backstop for calls made outside the per-phase deadlines (the sync shims)
+            options["client_kwargs"] = {"timeout": httpx.Timeout(read_timeout, connect=5.0)}
+        self.backends = [Backend(url, options) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._next = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def preload(self):
+        """Create every backend's client now (blocking import), so no request pays for it."""
+        for backend in self.backends:
+            backend.llm
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def pick(self, exclude: tuple = ()) -> Backend:
+        """Healthy backend with the fewest outstanding requests (round-robin on ties).
+
+        If every backend is ejected, fall back to the least loaded one rather than refusing.
+        """
+        pool = [b for b in self.backends if b not in exclude] or self.backends
+        candidates = [b for b in pool if b.healthy] or pool
+        fewest = min(b.outstanding for b in candidates)
+        tied = [b for b in candidates if b.outstanding == fewest]
+        self._next = (self._next + 1) % len(tied) if len(tied) > 1 else 0
+        return tied[self._next % len(tied)]
+
+    @contextmanager
+    def lease(self, exclude: tuple = ()) -> Iterator[Backend]:
+        """Route one call; usable from both sync and async code."""
+        backend = self.pick(exclude)
+        backend.outstanding += 1
+        try:
+            yield backend
+        except Exception as e:
+            # A server that blows the deadline is as unhealthy as one that errors
+            if self.is_backend_error(e) or (isinstance(e, DeadlineExceeded) and not e.by_request):
+                self.record_failure(backend, e)
+            raise
+        else:
+            backend.served += 1
+            backend.consecutive_failures = 0
+        finally:
+            backend.outstanding -= 1
+
+    def is_backend_error(self, error: BaseException) -> bool:
+        """Errors that point at the server rather than the request (worth retrying elsewhere)."""
+        from ollama import ResponseError
+        return isinstance(error, (ResponseError, httpx.HTTPError, ConnectionError, OSError))
+
+    def record_failure(self, backend: Backend, error: Exception):
+        backend.consecutive_failures += 1
+        backend.last_error = f"{type(error).__name__}: {error}"[:200]
+        if backend.healthy and backend.consecutive_failures >= self.failure_threshold:
+            backend.healthy = False
+            logger.warning("Ejecting Ollama backend %s: %s", backend.url, backend.last_error)
+
+    async def check(self, backend: Backend, client: httpx.AsyncClient):
+        """Probe one backend and eject/re-admit it."""
+        start = time.perf_counter()
+        try:
+            response = await client.get(f"{backend.url}/api/tags", timeout=self.check_timeout)
+            response.raise_for_status()
+        except Exception as e:
+            self.record_failure(backend, e)
+        else:
+            if not backend.healthy:
+                logger.info("Re-admitting Ollama backend %s", backend.url)
+            backend.healthy = True
+            backend.consecutive_failures = 0
+            backend.check_latency = time.perf_counter() - start
+        backend.last_checked = time.time()
+
+    async def check_all(self):
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*(self.check(b, client) for b in self.backends))
+
+    async def _health_loop(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.check_interval)
+
+    def start_health_checks(self):
+        """Begin background health checks (call from a running event loop)."""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    def status(self) -> list[dict]:
+        return [b.status() for b in self.backends]
+
+    def any_healthy(self) -> bool:
+        return any(b.healthy for b in self.backends)
@@ -0,0 +1 @@
+"""Benchmarks and load tools for the Cortana backend (run from baackend/ with python -m)."""
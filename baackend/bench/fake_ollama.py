@@ -0,0 +1,190 @@
+"""
+Deterministic stand-in for the Ollama HTTP API
+Serves /api/chat (streaming NDJSON or single JSON) with a configurable token rate,
+time-to-first-token, cold-load delay and failure injection, so the backend can be load
+tested without a model. /api/generate with no prompt loads the model, as in Ollama.
+
+    cd baackend && python -m bench.fake_ollama --port 11435 --tokens-per-sec 40 --ttft-ms 300
+    OLLAMA_HOST=http://127.0.0.1:11435 python main.py
+"""
+
+from dataclasses import dataclass
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+WORDS = ("think about what happens when the input is empty and how each step brings you "
+         "closer to the base case so that the function eventually stops calling itself "
+         "try tracing a small example by hand and write down every value").split()
+
+
+@dataclass
+class FakeConfig:
+    """Knobs for the simulated model."""
+    tokens_per_sec: float = 40.0
+    ttft_ms: float = 300.0
+    response_tokens: int = 120
+    failure_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 30.0
+    load_ms: float = 0.0
+    seed: int = 0
+
+
+def _keep_alive_seconds(value) -> float:
+    """Ollama keep_alive ('10m', '30s', '1h', seconds, negative = forever); default 5m."""
+    if value is None or value == "":
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        seconds = float(value[:-1]) * units[value[-1]]
+    else:
+        seconds = float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+def _rng_for(config: FakeConfig, messages: list) -> random.Random:
+    """Same messages + seed => same output, failures and timing."""
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).digest()
+    return random.Random(config.seed ^ int.from_bytes(digest[:8], "big"))
+
+
+def _tokens_for(config: FakeConfig, messages: list, rng: random.Random, json_mode: bool = False) -> list[str]:
+    last = messages[-1].get("content", "") if messages else ""
+    if "JSON array" in last:
+        # Review prompts get a well-formed feedback array
+        feedback = [
+            {"type": "hint", "message": "What happens when the input is empty?", "line": 1},
+            {"type": "question", "message": "Can you trace this with a small example?"},
+        ]
+        text = json.dumps({"feedback": feedback} if json_mode else feedback)
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    if json_mode:
+        # JSON mode always produces an object; quiz prompts get a well-formed question
+        quiz = {"question": "What does a function need in order to stop calling itself?",
+                "options": ["A base case", "A loop", "A global variable", "An import"], "answer": 0}
+        text = json.dumps(quiz)
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    count = max(1, int(rng.gauss(config.response_tokens, config.response_tokens / 5)))
+    return [rng.choice(WORDS) + " " for _ in range(count)]
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    """Build the fake Ollama app."""
+    app = FastAPI(title="Fake Ollama")
+    state = {"loaded_until": 0.0}
+
+    async def load(body: dict):
+        """Pay the cold-load cost if the model isn't resident, then extend its residency."""
+        now = time.monotonic()
+        if now >= state["loaded_until"] and config.load_ms > 0:
+            await asyncio.sleep(config.load_ms / 1000)
+        state["loaded_until"] = time.monotonic() + _keep_alive_seconds(body.get("keep_alive"))
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "0.0.0-fake"}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "phi:latest", "model": "phi:latest", "size": 0}]}
+
+    @app.post("/api/generate")
+    async def generate_endpoint(request: Request):
+        body = await request.json()
+        if body.get("prompt"):
+            return JSONResponse({"error": "the fake only serves empty (load) prompts"}, status_code=400)
+        await load(body)
+        return {"model": body.get("model", "phi"), "response": "", "done": True, "done_reason": "load"}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "phi")
+        rng = _rng_for(config, messages)
+        if rng.random() < config.failure_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        stall = rng.random() < config.stall_rate
+        tokens = _tokens_for(config, messages, rng, json_mode=body.get("format") == "json")
+        num_predict = (body.get("options") or {}).get("num_predict")
+        if num_predict is not None and num_predict >= 0:
+            tokens = tokens[:max(1, num_predict)]
+        delay = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0.0
+        started = time.perf_counter()
+
+        def frame(content: str, done: bool) -> dict:
+            data = {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+            if done:
+                data.update({
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - started) * 1e9),
+                    "prompt_eval_count": sum(len(m.get("content", "")) // 4 for m in messages),
+                    "eval_count": len(tokens),
+                })
+            return data
+
+        await load(body)
+        if not body.get("stream", True):
+            await asyncio.sleep(config.ttft_ms / 1000 + delay * len(tokens))
+            return frame("".join(tokens), True)
+
+        async def generate():
+            await asyncio.sleep(config.ttft_ms / 1000)
+            for i, token in enumerate(tokens):
+                if stall and i == len(tokens) // 2:
+                    await asyncio.sleep(config.stall_seconds)
+                yield json.dumps(frame(token, False)) + "\n"
+                await asyncio.sleep(delay)
+            yield json.dumps(frame("", True)) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-sec", type=float, default=FakeConfig.tokens_per_sec)
+    parser.add_argument("--ttft-ms", type=float, default=FakeConfig.ttft_ms)
+    parser.add_argument("--response-tokens", type=int, default=FakeConfig.response_tokens)
+    parser.add_argument("--failure-rate", type=float, default=FakeConfig.failure_rate)
+    parser.add_argument("--stall-rate", type=float, default=FakeConfig.stall_rate)
+    parser.add_argument("--stall-seconds", type=float, default=FakeConfig.stall_seconds)
+    parser.add_argument("--load-ms", type=float, default=FakeConfig.load_ms,
+                        help="cold-load delay when the model isn't resident (keep_alive expired)")
+    parser.add_argument("--seed", type=int, default=FakeConfig.seed)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeConfig(
+        tokens_per_sec=args.tokens_per_sec,
+        ttft_ms=args.ttft_ms,
+        response_tokens=args.response_tokens,
+        failure_rate=args.failure_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        load_ms=args.load_ms,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
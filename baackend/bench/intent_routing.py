@@ -0,0 +1,60 @@
+"""
+Microbenchmark: per-message routing cost of the intent router
+Compares the single-pass IntentRouter against the previous chain of keyword scans.
+
+    cd baackend && python -m bench.intent_routing
+"""
+
+import re
+import timeit
+
+from intents import Intent, default_router
+
+
+SAMPLES = [
+    "How do I implement a binary search?",
+    "I'm at the intermediate level.",
+    "D1: A, D2: B",
+    "```python\ndef fib(n):\n    return n if n < 2 else fib(n - 1) + fib(n - 2)\n```",
+    "I think the base case stops the recursion, right?",
+    "Can you explain why my loop never ends? " * 20,
+]
+
+
+def legacy_route(message: str, is_new: bool) -> Intent:
+    """The pre-router branch order of chat_stream, kept for comparison."""
+    keywords = ['code', 'implement', 'write', 'show me', 'give me', 'solution',
+                'answer', 'how to', 'how do i', 'example', 'program', 'explain',
+                'what is', 'why', 'understand', 'learn', 'teach', 'help me']
+    is_educational = any(kw in message.lower() for kw in keywords)
+    code_indicators = ['```', 'def ', 'function ', 'class ', 'for ', 'while ', 'if ']
+    has_code = any(ind in message for ind in code_indicators)
+    if re.findall(r'[Dd]\d\s*:\s*([ABCabc])', message):
+        return Intent.DIAGNOSTIC_ANSWER
+    if has_code:
+        re.search(r'```[\w]*\n?([\s\S]*?)```', message)
+        return Intent.CODE_SUBMISSION
+    if is_new and is_educational:
+        return Intent.NEW_TOPIC
+    for kw in ["beginner", "intermediate", "advanced"]:
+        if kw in message.lower():
+            return Intent.LEVEL_SELECT
+    return Intent.TEACH
+
+
+def main(number: int = 20000):
+    router = default_router()
+    for msg in SAMPLES:
+        for is_new in (True, False):
+            assert router.route(msg, is_new).intent == legacy_route(msg, is_new), msg
+
+    print(f"{'message':<42} {'legacy us':>10} {'router us':>10}  intent")
+    for msg in SAMPLES:
+        legacy = timeit.timeit(lambda: legacy_route(msg, False), number=number) / number * 1e6
+        routed = timeit.timeit(lambda: router.route(msg, False), number=number) / number * 1e6
+        label = msg.replace("\n", " ")[:40]
+        print(f"{label:<42} {legacy:>10.2f} {routed:>10.2f}  {router.route(msg, False).intent.value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Load generator for the Cortana API
+Drives /chat (SSE and non-streaming) and /review with many concurrent simulated learners,
+replaying conversation scripts, and reports latency percentiles, tokens/sec and error rates.
+
+    cd baackend && python -m bench.load_test --url http://127.0.0.1:8000 --learners 50 --duration 60
+
+--websocket drives the same scripts over one /ws/chat connection per learner instead.
+
+A script file is JSON: a list of conversations, each a list of turns such as
+{"message": "How do I implement recursion?"}, {"message": "...", "stream": false}
+or {"review": "def f(n): ..."}.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+
+DEFAULT_SCRIPTS = [
+    [
+        {"message": "How do I implement recursion?"},
+        {"message": "I'm at the beginner level."},
+        {"message": "D1: B, D2: C"},
+        {"message": "So the base case is what stops it?"},
+        {"review": "def fact(n):\n    return n * fact(n - 1)\n"},
+    ],
+    [
+        {"message": "What is a linked list?"},
+        {"message": "I'm at the intermediate level."},
+        {"message": "D1: A, D2: B"},
+        {"message": "Why would I pick it over an array?", "stream": False},
+    ],
+    [
+        {"message": "Explain binary search"},
+        {"message": "I'm at the advanced level."},
+        {"message": "D1: A, D2: A"},
+        {"message": "What about duplicates in the array?"},
+        {"review": "def bs(a, x):\n    lo, hi = 0, len(a)\n    while lo < hi:\n        mid = (lo + hi) // 2\n"},
+    ],
+]
+
+
+@dataclass
+class Sample:
+    """One request's outcome."""
+    kind: str
+    ok: bool
+    ttfb: Optional[float] = None
+    total: float = 0.0
+    tokens: int = 0
+    error: Optional[str] = None
+    sent: int = 0  # request payload bytes
+
+
+@dataclass
+class Results:
+    samples: list[Sample] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    finished: float = 0.0
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def chat_turn(client: httpx.AsyncClient, turn: dict, history: list[dict], session_id: Optional[str]) -> tuple[Sample, str]:
+    """Send one chat turn; returns the sample and the assistant reply."""
+    stream = turn.get("stream", True)
+    body = {"message": turn["message"], "stream": stream}
+    if session_id:
+        body["session_id"] = session_id
+    else:
+        body["history"] = history
+    kind = "chat_stream" if stream else "chat"
+    sent = len(json.dumps(body))
+    start = time.perf_counter()
+
+    if not stream:
+        response = await client.post("/chat", json=body)
+        total = time.perf_counter() - start
+        if response.status_code != 200:
+            return Sample(kind, False, total=total, error=f"HTTP {response.status_code}"), ""
+        reply = response.json().get("response", "")
+        return Sample(kind, True, ttfb=total, total=total, tokens=len(reply.split()), sent=sent), reply
+
+    ttfb = None
+    parts = []
+    async with client.stream("POST", "/chat", json=body) as response:
+        if response.status_code != 200:
+            return Sample(kind, False, total=time.perf_counter() - start, error=f"HTTP {response.status_code}"), ""
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = json.loads(line[6:])
+            if "content" in data or "phase" in data:
+                # Phase cards (event: phase) are a response too
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                if "content" in data:
+                    parts.append(data["content"])
+            elif "error" in data:
+                return Sample(kind, False, ttfb, time.perf_counter() - start, _words(parts), data["error"], sent), ""
+            elif data.get("done"):
+                break
+    return Sample(kind, True, ttfb, time.perf_counter() - start, _words(parts), sent=sent), "".join(parts)
+
+
+def _words(parts: list[str]) -> int:
+    """Words in a streamed reply, the same measure as the non-stream path (frames are coalesced,
+    so they say nothing about the number of tokens)."""
+    return len("".join(parts).split())
+
+
+async def review_turn(client: httpx.AsyncClient, code: str, level: str) -> Sample:
+    body = {"code": code, "user_level": level}
+    start = time.perf_counter()
+    response = await client.post("/review", json=body)
+    total = time.perf_counter() - start
+    if response.status_code != 200:
+        return Sample("review", False, total=total, error=f"HTTP {response.status_code}", sent=len(json.dumps(body)))
+    return Sample("review", True, ttfb=total, total=total, tokens=len(response.json().get("feedback", [])),
+                  sent=len(json.dumps(body)))
+
+
+async def socket_turn(ws, turn_id: str, frame: dict, kind: str) -> Sample:
+    """One turn over an open /ws/chat connection (turns run one at a time per learner)."""
+    payload = json.dumps({"id": turn_id, **frame})
+    start = time.perf_counter()
+    await ws.send(payload)
+    ttfb = None
+    parts = []
+    items = 0
+    while True:
+        message = json.loads(await ws.recv())
+        if message.get("id") != turn_id:
+            continue
+        if message["type"] in ("token", "phase", "feedback"):
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            if message["type"] == "token":
+                parts.append(message["content"])
+            else:
+                items += 1
+        elif message["type"] == "done":
+            total = time.perf_counter() - start
+            return Sample(kind, True, ttfb if ttfb is not None else total, total, _words(parts) + items,
+                          sent=len(payload))
+        else:
+            return Sample(kind, False, ttfb, time.perf_counter() - start, _words(parts) + items,
+                          message.get("error") or message["type"], len(payload))
+
+
+async def socket_learner(url: str, scripts: list, results: Results, deadline: float, think_time: float,
+                         timeout: float, rng: random.Random):
+    """Replay scripts over WebSocket: one connection (and session) per conversation."""
+    import websockets
+
+    ws_url = url.replace("http", "ws", 1).rstrip("/") + "/ws/chat"
+    while time.perf_counter() < deadline:
+        script = rng.choice(scripts)
+        try:
+            async with websockets.connect(ws_url, open_timeout=timeout, max_size=None) as ws:
+                await ws.recv()  # session frame
+                for index, turn in enumerate(script):
+                    if time.perf_counter() >= deadline:
+                        return
+                    if "review" in turn:
+                        frame = {"type": "review", "code": turn["review"], "user_level": turn.get("level", "beginner")}
+                        kind = "ws_review"
+                    else:
+                        frame = {"type": "chat", "message": turn["message"]}
+                        kind = "ws_chat"
+                    try:
+                        sample = await asyncio.wait_for(socket_turn(ws, str(index), frame, kind), timeout)
+                    except asyncio.TimeoutError:
+                        sample = Sample(kind, False, error="timeout")
+                    results.samples.append(sample)
+                    if think_time:
+                        await asyncio.sleep(rng.uniform(0, 2 * think_time))
+        except (OSError, websockets.WebSocketException) as e:
+            results.samples.append(Sample("ws_chat", False, error=type(e).__name__))
+
+
+async def learner(client: httpx.AsyncClient, scripts: list, results: Results, deadline: float,
+                  use_sessions: bool, think_time: float, rng: random.Random):
+    """Replay scripts back to back until the deadline."""
+    while time.perf_counter() < deadline:
+        script = rng.choice(scripts)
+        history: list[dict] = []
+        session_id = None
+        if use_sessions:
+            response = await client.post("/sessions", json={})
+            session_id = response.json()["session_id"] if response.status_code == 200 else None
+        for turn in script:
+            if time.perf_counter() >= deadline:
+                return
+            try:
+                if "review" in turn:
+                    sample = await review_turn(client, turn["review"], turn.get("level", "beginner"))
+                else:
+                    sample, reply = await chat_turn(client, turn, history, session_id)
+                    history += [{"role": "user", "content": turn["message"]},
+                                {"role": "assistant", "content": reply}]
+            except (httpx.HTTPError, ValueError) as e:
+                sample = Sample("review" if "review" in turn else "chat", False, error=type(e).__name__)
+            results.samples.append(sample)
+            if think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+
+def report(results: Results) -> dict:
+    """Aggregate samples per request kind."""
+    elapsed = results.finished - results.started
+    by_kind = defaultdict(list)
+    for s in results.samples:
+        by_kind[s.kind].append(s)
+    summary = {"elapsed_s": round(elapsed, 2), "kinds": {}}
+    for kind, samples in sorted(by_kind.items()):
+        ok = [s for s in samples if s.ok]
+        ttfb = [s.ttfb for s in ok if s.ttfb is not None]
+        total = [s.total for s in ok]
+        rates = [s.tokens / s.total for s in ok if s.total > 0 and s.tokens]
+        errors = defaultdict(int)
+        for s in samples:
+            if not s.ok:
+                errors[s.error] += 1
+        summary["kinds"][kind] = {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(1 - len(ok) / len(samples), 4),
+            "errors": dict(errors),
+            "ttfb_ms": {p: round(percentile(ttfb, q) * 1000, 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+            "total_ms": {p: round(percentile(total, q) * 1000, 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+            "tokens_per_sec_p50": round(percentile(rates, 50), 1),
+            "request_bytes_avg": round(sum(s.sent for s in samples) / len(samples), 1),
+        }
+    return summary
+
+
+def print_report(summary: dict):
+    print(f"elapsed: {summary['elapsed_s']}s")
+    header = (f"{'kind':<12} {'reqs':>6} {'rps':>7} {'err%':>6} {'ttfb p50':>9} {'p95':>8} {'p99':>8} "
+              f"{'total p50':>10} {'tok/s':>7} {'req B':>7}")
+    print(header)
+    for kind, k in summary["kinds"].items():
+        print(f"{kind:<12} {k['requests']:>6} {k['throughput_rps']:>7} {k['error_rate'] * 100:>6.1f} "
+              f"{k['ttfb_ms']['p50']:>9} {k['ttfb_ms']['p95']:>8} {k['ttfb_ms']['p99']:>8} "
+              f"{k['total_ms']['p50']:>10} {k['tokens_per_sec_p50']:>7} {k['request_bytes_avg']:>7}")
+        for error, count in k["errors"].items():
+            print(f"    {count} x {error}")
+
+
+async def run(url: str, learners: int, duration: float, scripts: list, use_sessions: bool,
+              think_time: float, timeout: float, seed: int, websocket: bool = False) -> dict:
+    results = Results()
+    deadline = time.perf_counter() + duration
+    if websocket:
+        await asyncio.gather(*(
+            socket_learner(url, scripts, results, deadline, think_time, timeout, random.Random(seed + i))
+            for i in range(learners)
+        ))
+        results.finished = time.perf_counter()
+        return report(results)
+    limits = httpx.Limits(max_connections=learners, max_keepalive_connections=learners)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(
+            learner(client, scripts, results, deadline, use_sessions, think_time, random.Random(seed + i))
+            for i in range(learners)
+        ))
+    results.finished = time.perf_counter()
+    return report(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--learners", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--scripts", help="JSON file of conversation scripts (default: built-in)")
+    parser.add_argument("--sessions", action="store_true", help="use server-side sessions instead of resending history")
+    parser.add_argument("--websocket", action="store_true", help="use one /ws/chat connection per conversation")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between a learner's turns")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    scripts = DEFAULT_SCRIPTS
+    if args.scripts:
+        with open(args.scripts, encoding="utf-8") as f:
+            scripts = json.load(f)
+
+    summary = asyncio.run(run(args.url, args.learners, args.duration, scripts, args.sessions,
+                              args.think_time, args.timeout, args.seed, args.websocket))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Throughput vs. worker count
+Starts the fake Ollama server, then for each worker count runs serve.py and the load test
+against it, and prints requests/sec and latency side by side.
+
+    cd baackend && python -m bench.workers --workers 1,2,4 --learners 40 --duration 20
+
+Model time is simulated, so this measures the API tier (JSON, SSE, prompt building, session
+I/O). Scaling is bounded by the host's cores: expect no gain beyond os.cpu_count() workers.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.load_test import DEFAULT_SCRIPTS, run
+
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def bench(workers: int, args) -> dict:
+    state_dir = tempfile.mkdtemp(prefix="cortana-bench-")
+    env = dict(os.environ, OLLAMA_HOST=f"http://127.0.0.1:{args.fake_port}", CORTANA_WARMUP="0",
+               CORTANA_CURRICULUM_DIR="", CORTANA_STATE_DIR=state_dir if workers > 1 or args.shared else "")
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port), "--log-level", "warning"],
+        cwd=HERE, env=env
+    )
+    try:
+        url = f"http://127.0.0.1:{args.port}"
+        wait_until_up(url + "/health")
+        return asyncio.run(run(url, args.learners, args.duration, DEFAULT_SCRIPTS, args.sessions,
+                               think_time=0.0, timeout=args.timeout, seed=args.seed))
+    finally:
+        stop(server)
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--learners", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per worker count")
+    parser.add_argument("--sessions", action="store_true", help="use server-side sessions")
+    parser.add_argument("--shared", action="store_true", help="use shared state even for one worker")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--fake-port", type=int, default=11436)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_ollama", "--port", str(args.fake_port),
+         "--tokens-per-sec", str(args.tokens_per_sec)],
+        cwd=HERE
+    )
+    rows = []
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.fake_port}/api/tags")
+        for workers in (int(w) for w in args.workers.split(",")):
+            print(f"--- {workers} worker(s)")
+            summary = bench(workers, args)
+            for kind, k in summary["kinds"].items():
+                rows.append((workers, kind, k))
+    finally:
+        stop(fake)
+
+    print(f"\n{'workers':>7} {'kind':<12} {'rps':>7} {'err%':>6} {'ttfb p50':>9} {'p95':>8} {'total p50':>10} {'p95':>8}")
+    for workers, kind, k in rows:
+        print(f"{workers:>7} {kind:<12} {k['throughput_rps']:>7} {k['error_rate'] * 100:>6.1f} "
+              f"{k['ttfb_ms']['p50']:>9} {k['ttfb_ms']['p95']:>8} {k['total_ms']['p50']:>10} {k['total_ms']['p95']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Precomputed curriculum for popular topics
+Step-1 lessons and a quiz per (normalized topic, level), generated offline into a gzip'd
+JSON file per prompt version, so the first lesson for common topics needs no model call.
+
+    cd baackend && python curriculum.py build --catalog curriculum_catalog.json --out curriculum_store
+"""
+
+from typing import Optional
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from metrics import CURRICULUM_LOOKUPS
+
+
+logger = logging.getLogger("cortana.curriculum")
+
+LEVELS = ("beginner", "intermediate", "advanced")
+
+# Leading request phrasing that doesn't change the topic ("teach me", "how do i"...)
+_FILLER = re.compile(
+    r"^((please|can you|could you|i want to|i'd like to|help me|teach me( about)?|explain|learn( about)?|"
+    r"understand|what (is|are)|how do (i|you)|how does|tell me about|show me|implement|use|write|an?|the)\s+)*"
+)
+_SUFFIX = re.compile(r"\s+(in python|in javascript|in js|in java|in c\+\+|please|work|works)$")
+
+
+def normalize_topic(text: str) -> str:
+    """'Can you teach me Linked Lists in Python?' -> 'linked list'."""
+    text = re.sub(r"[^\w\s+#]", " ", (text or "").lower())
+    text = re.sub(r"\s+", " ", text).strip()
+    text = _FILLER.sub("", text, count=1)
+    text = _SUFFIX.sub("", text)
+    return " ".join(_singular(w) for w in text.split())
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3:
+        return word
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def prompt_version(*parts: str) -> str:
+    """Content hash of everything that shapes a lesson (system prompt, lesson template, model)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode())
+        h.update(b"\x00")
+    return h.hexdigest()[:12]
+
+
+class CurriculumStore:
+    """Read side: lessons for the current prompt version, looked up by topic and level.
+
+    Each prompt version lives in its own `<version>.json.gz`, so changing the system prompt
+    simply misses until the curriculum is rebuilt, and older versions stay usable on rollback.
+    """
+
+    def __init__(self, directory: str, version: str):
+        self.directory = directory
+        self.version = version
+        self.aliases: dict[str, str] = {}
+        self.entries: dict[str, dict] = {}
+        self.topics: set[str] = set()
+        self.load()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.version}.json.gz")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            if os.path.isdir(self.directory) and os.listdir(self.directory):
+                logger.warning("No curriculum for prompt version %s in %s; rebuild it", self.version, self.directory)
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        self.aliases = data.get("aliases", {})
+        self.entries = data.get("entries", {})
+        self.topics = {key.split("|", 1)[0] for key in self.entries}
+        logger.info("Loaded %d curriculum entries (version %s)", len(self.entries), self.version)
+
+    def resolve(self, text: str) -> Optional[str]:
+        """Catalog topic for free-form learner text, if any."""
+        topic = normalize_topic(text)
+        return self.aliases.get(topic, topic if topic in self.topics else None)
+
+    def has(self, text: str, level: str) -> bool:
+        topic = self.resolve(text) if self.entries else None
+        return topic is not None and f"{topic}|{level}" in self.entries
+
+    def get(self, text: str, level: str) -> Optional[dict]:
+        """{"lesson": str, "quiz": dict or None} for the topic the text asks about."""
+        topic = self.resolve(text) if self.entries else None
+        entry = self.entries.get(f"{topic}|{level}") if topic else None
+        CURRICULUM_LOOKUPS.inc(outcome="miss" if entry is None else "hit")
+        return entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def write_store(directory: str, version: str, aliases: dict, entries: dict, model: str) -> str:
+    """Atomically write one prompt version's curriculum."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{version}.json.gz")
+    data = {"version": version, "model": model, "created": time.time(), "aliases": aliases, "entries": entries}
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+def _load_catalog(path: str) -> tuple[list[str], dict]:
+    """Catalog: [{"topic": "linked list", "aliases": ["linked lists", "singly linked list"]}, ...]."""
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    topics, aliases = [], {}
+    for item in catalog:
+        topic = normalize_topic(item["topic"])
+        topics.append(topic)
+        for alias in item.get("aliases", []):
+            aliases[normalize_topic(alias)] = topic
+    return topics, aliases
+
+
+async def build(agent, catalog_path: str, out_dir: str, levels: tuple = LEVELS, concurrency: int = 2,
+                resume: bool = True) -> str:
+    """Generate every (topic, level) lesson + quiz in the catalog for the agent's prompt version."""
+    topics, aliases = _load_catalog(catalog_path)
+    version = agent.curriculum_version()
+    entries = {}
+    existing = os.path.join(out_dir, f"{version}.json.gz")
+    if resume and os.path.exists(existing):
+        with gzip.open(existing, "rt", encoding="utf-8") as f:
+            entries = json.load(f).get("entries", {})
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(topic: str, level: str):
+        key = f"{topic}|{level}"
+        if key in entries:
+            return
+        async with semaphore:
+            start = time.perf_counter()
+            entries[key] = await agent.generate_curriculum_entry(topic, level)
+            print(f"  {key}: {len(entries[key]['lesson'])} chars in {time.perf_counter() - start:.1f}s")
+
+    jobs = [one(topic, level) for topic in topics for level in levels]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    for failure in failures:
+        print(f"  failed: {failure}")
+    path = write_store(out_dir, version, aliases, entries, agent.model_name)
+    print(f"Wrote {len(entries)} entries ({len(failures)} failed) to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="pre-generate lessons for the catalog")
+    build_cmd.add_argument("--catalog", default=os.path.join(os.path.dirname(__file__), "curriculum_catalog.json"))
+    build_cmd.add_argument("--out", default=os.getenv("CORTANA_CURRICULUM_DIR", "curriculum_store"))
+    build_cmd.add_argument("--model", default="phi")
+    build_cmd.add_argument("--levels", default=",".join(LEVELS))
+    build_cmd.add_argument("--concurrency", type=int, default=2)
+    build_cmd.add_argument("--no-resume", action="store_true", help="regenerate entries already in the store")
+    args = parser.parse_args()
+
+    from agent import create_agent
+    hosts = [h.strip() for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()] or None
+    agent = create_agent(model_name=args.model, ollama_hosts=hosts, prefetch=False)
+    asyncio.run(build(agent, args.catalog, args.out, tuple(args.levels.split(",")), args.concurrency,
+                      resume=not args.no_resume))
+
+
+if __name__ == "__main__":
+    main()
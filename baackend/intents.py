@@ -0,0 +1,153 @@
+"""
+Intent routing for chat turns
+Ordered rules over a lazily evaluated message scan map each turn to a typed intent
+"""
+
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, Optional
+import re
+
+
+class Intent(str, Enum):
+    """What a chat turn is asking for."""
+    DIAGNOSTIC_ANSWER = "DIAGNOSTIC_ANSWER"
+    CODE_SUBMISSION = "CODE_SUBMISSION"
+    NEW_TOPIC = "NEW_TOPIC"
+    LEVEL_SELECT = "LEVEL_SELECT"
+    TEACH = "TEACH"
+
+
+EDUCATIONAL_KEYWORDS = ['code', 'implement', 'write', 'show me', 'give me', 'solution',
+                        'answer', 'how to', 'how do i', 'example', 'program', 'explain',
+                        'what is', 'why', 'understand', 'learn', 'teach', 'help me']
+CODE_INDICATORS = ['```', 'def ', 'function ', 'class ', 'for ', 'while ', 'if ']
+LEVEL_KEYWORDS = ["beginner", "intermediate", "advanced"]
+
+
+_DIAGNOSTIC_ANSWER = re.compile(r'[Dd]\d\s*:\s*([ABCabc])')
+_CODE_BLOCK = re.compile(r'```[\w]*\n?([\s\S]*?)```')
+
+
+class Scan:
+    """Routing features of one message, each computed at most once and only when a rule asks.
+    
+    The message is lowercased once; later rules never rescan what earlier ones already
+    decided, so a code submission never pays for the keyword scans below it.
+    """
+    
+    __slots__ = ("message", "is_new", "_lower", "_answers", "_has_code", "_is_educational")
+    
+    def __init__(self, message: str, is_new: bool = False):
+        self.message = message
+        self.is_new = is_new
+        self._lower = None
+        self._answers = None
+        self._has_code = None
+        self._is_educational = None
+    
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.message.lower()
+        return self._lower
+    
+    @property
+    def answers(self) -> list[str]:
+        if self._answers is None:
+            self._answers = _DIAGNOSTIC_ANSWER.findall(self.message) if ":" in self.message else []
+        return self._answers
+    
+    @property
+    def has_code(self) -> bool:
+        if self._has_code is None:
+            self._has_code = any(ind in self.message for ind in CODE_INDICATORS)
+        return self._has_code
+    
+    @property
+    def is_educational(self) -> bool:
+        if self._is_educational is None:
+            lower = self.lower
+            self._is_educational = any(kw in lower for kw in EDUCATIONAL_KEYWORDS)
+        return self._is_educational
+    
+    def level(self) -> Optional[str]:
+        """First level keyword mentioned, in LEVEL_KEYWORDS priority order."""
+        lower = self.lower
+        for level in LEVEL_KEYWORDS:
+            if level in lower:
+                return level
+        return None
+
+
+@dataclass
+class RoutedIntent:
+    """A classified turn plus the fields its handler needs."""
+    intent: Intent
+    answers: list[str] = field(default_factory=list)
+    code: Optional[str] = None
+    topic: Optional[str] = None
+    level: Optional[str] = None
+
+
+def scan(message: str, is_new: bool = False) -> Scan:
+    """Wrap a message for routing."""
+    return Scan(message, is_new)
+
+
+def _diagnostic_rule(s: Scan) -> Optional[RoutedIntent]:
+    if s.answers:
+        return RoutedIntent(Intent.DIAGNOSTIC_ANSWER, answers=s.answers)
+    return None
+
+
+def _code_rule(s: Scan) -> Optional[RoutedIntent]:
+    if s.has_code:
+        code_match = _CODE_BLOCK.search(s.message)
+        return RoutedIntent(Intent.CODE_SUBMISSION, code=code_match.group(1) if code_match else s.message)
+    return None
+
+
+def _new_topic_rule(s: Scan) -> Optional[RoutedIntent]:
+    if s.is_new and s.is_educational:
+        topic = s.lower.replace("how do i ", "").replace("implement ", "").replace("?", "").strip()
+        return RoutedIntent(Intent.NEW_TOPIC, topic=topic)
+    return None
+
+
+def _level_rule(s: Scan) -> Optional[RoutedIntent]:
+    level = s.level()
+    if level:
+        return RoutedIntent(Intent.LEVEL_SELECT, level=level)
+    return None
+
+
+class IntentRouter:
+    """Ordered rule registry; the first rule that matches decides the intent."""
+
+    def __init__(self):
+        self._rules: list[tuple[int, str, Callable[[Scan], Optional[RoutedIntent]]]] = []
+
+    def register(self, name: str, rule: Callable[[Scan], Optional[RoutedIntent]], priority: int):
+        """Add a rule. Lower priority values are tried first."""
+        self._rules.append((priority, name, rule))
+        self._rules.sort(key=lambda r: r[0])
+
+    def route(self, message: str, is_new: bool = False) -> RoutedIntent:
+        """Classify a message; falls through to TEACH."""
+        s = scan(message, is_new)
+        for _, _, rule in self._rules:
+            routed = rule(s)
+            if routed is not None:
+                return routed
+        return RoutedIntent(Intent.TEACH)
+
+
+def default_router() -> IntentRouter:
+    """The Socratic flow's routing order."""
+    router = IntentRouter()
+    router.register("diagnostic_answer", _diagnostic_rule, 10)
+    router.register("code_submission", _code_rule, 20)
+    router.register("new_topic", _new_topic_rule, 30)
+    router.register("level_select", _level_rule, 40)
+    return router
@@ -2,14 +2,29 @@
 FastAPI Backend for Cortana - Level-Aware Socratic Teaching Assistant
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import AsyncIterator, Optional, Union
+import asyncio
 import json
+import os
+import time
+import uuid
 
 from agent import create_agent, OllamaAgent
+from intents import RoutedIntent
+from metrics import REGISTRY, TraceMiddleware, current_trace, start_trace
+from resilience import (
+    DEFAULT_TOTAL, DEFAULT_TTFT, OPEN, STATE_VALUES, CircuitBreaker, CircuitOpen, DeadlineExceeded, DeadlineMiddleware,
+    PhaseDeadlines, parse_deadlines, start_deadline
+)
+from scheduler import Overloaded, parse_classes, set_flow
+from sessions import Session
+from shared_state import create_state
+from streaming import GenerationRegistry, PhaseEvent, coalesce
+from warmup import ModelWarmer, parse_hours
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -27,9 +42,115 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# One trace id per request (honours an incoming X-Request-ID)
+app.add_middleware(TraceMiddleware)
+
 # Create the agent
 agent: OllamaAgent = None
 
+# State every worker process must agree on. Set CORTANA_STATE_DIR (serve.py does) when running
+# more than one worker: sessions, the review cache, model slots and cancels then live there.
+state = create_state(os.getenv("CORTANA_STATE_DIR"))
+
+# Server-side conversation sessions (set CORTANA_SESSION_DB to persist to SQLite)
+sessions = state.session_store(
+    max_sessions=int(os.getenv("CORTANA_SESSION_MAX", "1000")),
+    ttl_seconds=float(os.getenv("CORTANA_SESSION_TTL", str(6 * 3600))),
+    db_path=os.getenv("CORTANA_SESSION_DB")
+)
+# Expired sessions are also dropped when next touched; this sweeps the ones nobody comes back for
+SESSION_PURGE_INTERVAL = float(os.getenv("CORTANA_SESSION_PURGE_INTERVAL", "600"))
+session_purger: asyncio.Task = None
+
+# Reviews keyed on normalized source (set CORTANA_REVIEW_CACHE_DIR for a disk tier)
+review_cache = state.review_cache(
+    max_entries=int(os.getenv("CORTANA_REVIEW_CACHE_SIZE", "1024")),
+    disk_dir=os.getenv("CORTANA_REVIEW_CACHE_DIR")
+)
+
+# SSE frame coalescing: flush every N ms or N characters (0 and 0 disables)
+STREAM_FLUSH_MS = float(os.getenv("CORTANA_STREAM_FLUSH_MS", "30"))
+STREAM_FLUSH_BYTES = int(os.getenv("CORTANA_STREAM_FLUSH_BYTES", "256"))
+
+# Model calls made for one request must finish within this many seconds (0 disables; clients may
+# ask for less with X-Request-Timeout). Each call is also bounded per phase: time to first token
+# and total generation time ("default=30,review=45").
+REQUEST_DEADLINE = float(os.getenv("CORTANA_REQUEST_DEADLINE", "180")) or None
+PHASE_DEADLINES = PhaseDeadlines(
+    ttft=parse_deadlines(os.getenv("CORTANA_TTFT_DEADLINES", ""), DEFAULT_TTFT),
+    total=parse_deadlines(os.getenv("CORTANA_GENERATION_DEADLINES", ""), DEFAULT_TOTAL)
+)
+app.add_middleware(DeadlineMiddleware, seconds=REQUEST_DEADLINE)
+
+# After N consecutive failed or slow (first token later than S seconds) model calls, refuse
+# model-bound requests for C seconds, then let one probe call through
+BREAKER = CircuitBreaker(
+    failure_threshold=int(os.getenv("CORTANA_BREAKER_FAILURES", "5")),
+    slow_call=float(os.getenv("CORTANA_BREAKER_SLOW_TTFT", "15")),
+    cooldown=float(os.getenv("CORTANA_BREAKER_COOLDOWN", "30"))
+)
+
+# Concurrent model calls per Ollama backend
+MAX_GENERATIONS = int(os.getenv("CORTANA_MAX_GENERATIONS", "4"))
+
+# How queued model calls share the slots ("interactive=8,review=2,background=1") and how long
+# each class may expect to wait before it gets a 429 ("interactive=15,review=60", "none" = never)
+SCHEDULER_CLASSES = parse_classes(os.getenv("CORTANA_QUEUE_WEIGHTS", ""), os.getenv("CORTANA_QUEUE_BUDGETS", ""))
+
+# Comma-separated Ollama servers; unset means the single OLLAMA_HOST / localhost default
+OLLAMA_HOSTS = [h.strip() for h in os.getenv("OLLAMA_HOSTS", "").split(",") if h.strip()] or None
+
+# Share one generation between identical concurrent prompts
+SINGLE_FLIGHT = os.getenv("CORTANA_SINGLE_FLIGHT", "1") != "0"
+
+# Preload the model at startup and keep it resident during business hours (local time)
+WARMUP = os.getenv("CORTANA_WARMUP", "1") != "0"
+# Create the model clients in the background right after startup (0 leaves it to the first call)
+PRELOAD_CLIENTS = os.getenv("CORTANA_PRELOAD_CLIENTS", "1") != "0"
+MODEL_KEEP_ALIVE = os.getenv("CORTANA_MODEL_KEEP_ALIVE", "10m")
+KEEPALIVE_HOURS = parse_hours(os.getenv("CORTANA_KEEPALIVE_HOURS", "8-18"))
+KEEPALIVE_INTERVAL = float(os.getenv("CORTANA_KEEPALIVE_INTERVAL", "240"))
+warmer: ModelWarmer = None
+
+# Ask Ollama for JSON-constrained review output (disable for models/servers without it)
+REVIEW_JSON_MODE = os.getenv("CORTANA_REVIEW_JSON_MODE", "1") != "0"
+
+# Generate the Step-1 lesson speculatively while the diagnostic is on screen
+PREFETCH_LESSONS = os.getenv("CORTANA_PREFETCH", "1") != "0"
+
+# Precomputed Step-1 lessons (build with `python curriculum.py build`)
+CURRICULUM_DIR = os.getenv("CORTANA_CURRICULUM_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "curriculum_store"))
+
+# Reuse answers to earlier first-turn questions for close paraphrases: "hash" (no model) or
+# "ollama:<embedding model>"; unset disables. Thresholds are cosine similarities per level.
+SEMANTIC_CACHE = os.getenv("CORTANA_SEMANTIC_CACHE", "")
+SEMANTIC_CACHE_SIZE = int(os.getenv("CORTANA_SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_DIR = os.getenv("CORTANA_SEMANTIC_CACHE_DIR")
+SEMANTIC_CACHE_THRESHOLDS = os.getenv("CORTANA_SEMANTIC_CACHE_THRESHOLDS", "")
+semantic_cache = None
+
+# /review/batch: reviews run concurrently per batch, and batches are capped in size
+BATCH_CONCURRENCY = int(os.getenv("CORTANA_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("CORTANA_BATCH_MAX_ITEMS", "200"))
+
+# Turns a single WebSocket connection may run at once
+WS_MAX_TURNS = int(os.getenv("CORTANA_WS_MAX_TURNS", "4"))
+# Close code for a /ws/chat resume whose session is gone (the WebSocket analogue of a 404)
+SESSION_EXPIRED_CLOSE = 4404
+
+# In-flight streamed generations, cancellable by request id or session id (from any worker)
+generations = GenerationRegistry()
+CANCEL_POLL_INTERVAL = 0.2
+cancel_listener: asyncio.Task = None
+
+REGISTRY.gauge("cortana_sessions", "Conversations held in memory", callback=lambda: len(sessions))
+REGISTRY.gauge("cortana_review_cache_hits", "Review cache hits", callback=lambda: review_cache.hits)
+REGISTRY.gauge("cortana_review_cache_misses", "Review cache misses", callback=lambda: review_cache.misses)
+REGISTRY.gauge("cortana_single_flight_active", "Distinct generations identical requests can currently join",
+               callback=lambda: agent.flights.in_flight() if agent is not None and agent.flights is not None else 0)
+REGISTRY.gauge("cortana_circuit_state", "Model circuit breaker (0 closed, 1 half-open, 2 open)",
+               callback=lambda: STATE_VALUES[BREAKER.state])
+
 
 class ChatMessage(BaseModel):
     role: str
@@ -41,47 +162,233 @@ class ChatRequest(BaseModel):
     history: Optional[list[ChatMessage]] = None
     stream: Optional[bool] = True
     user_level: Optional[str] = None  # beginner, intermediate, advanced
+    session_id: Optional[str] = None  # when set, history is kept server-side
 
 
 class CodeReviewRequest(BaseModel):
     code: str
     context: Optional[str] = "User submitted code for review"
     user_level: Optional[str] = "beginner"
+    bypass_cache: Optional[bool] = False
+
+
+class BatchReviewItem(CodeReviewRequest):
+    id: Optional[str] = None  # echoed back so results can be matched to submissions
+
+
+class BatchReviewRequest(BaseModel):
+    items: list[BatchReviewItem]
+    concurrency: Optional[int] = None  # may lower, never raise, the server limit
 
 
 class ChatResponse(BaseModel):
     response: str
     success: bool = True
+    session_id: Optional[str] = None
+
+
+class SessionCreateRequest(BaseModel):
+    user_level: Optional[str] = None
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+    user_level: Optional[str] = None
+    history: list[ChatMessage] = []
 
 
 class HealthResponse(BaseModel):
     status: str
     model: str
     features: list[str]
+    backends: list[dict] = []
+    warmup: Optional[dict] = None
+    circuit: Optional[dict] = None
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the agent on startup."""
-    global agent
+    global agent, warmer, cancel_listener, semantic_cache, session_purger
+    if SESSION_PURGE_INTERVAL > 0:
+        session_purger = asyncio.create_task(purge_sessions())
     try:
-        agent = create_agent(model_name="phi")
+        if SEMANTIC_CACHE:
+            from semantic_cache import SemanticCache, create_embedder, parse_thresholds
+            semantic_cache = SemanticCache(
+                create_embedder(SEMANTIC_CACHE, OLLAMA_HOSTS[0] if OLLAMA_HOSTS else None),
+                capacity=SEMANTIC_CACHE_SIZE,
+                directory=SEMANTIC_CACHE_DIR,
+                thresholds=parse_thresholds(SEMANTIC_CACHE_THRESHOLDS)
+            )
+            REGISTRY.gauge("cortana_semantic_cache_entries", "Answers held in the semantic cache",
+                           callback=lambda: len(semantic_cache))
+        agent = create_agent(
+            model_name="phi",
+            review_cache=review_cache,
+            max_concurrent_generations=MAX_GENERATIONS,
+            ollama_hosts=OLLAMA_HOSTS,
+            single_flight=SINGLE_FLIGHT,
+            keep_alive=MODEL_KEEP_ALIVE,
+            review_json_mode=REVIEW_JSON_MODE,
+            prefetch=PREFETCH_LESSONS,
+            curriculum_dir=CURRICULUM_DIR or None,
+            shared_state=state,
+            scheduler_classes=SCHEDULER_CLASSES,
+            semantic_cache=semantic_cache,
+            deadlines=PHASE_DEADLINES,
+            breaker=BREAKER
+        )
+        agent.backends.start_health_checks()
+        if PRELOAD_CLIENTS:
+            # Model clients import langchain_ollama; do that off the event loop once we're serving
+            asyncio.get_running_loop().run_in_executor(None, agent.backends.preload)
+        if WARMUP:
+            warmer = ModelWarmer(
+                agent.backends,
+                agent.model_name,
+                agent.system_prompt,
+                keep_alive=MODEL_KEEP_ALIVE,
+                interval=KEEPALIVE_INTERVAL,
+                business_hours=KEEPALIVE_HOURS
+            )
+            warmer.start()
+        if state.kind != "local":
+            cancel_listener = asyncio.create_task(listen_for_cancels())
         print("✅ Cortana initialized with level-aware teaching")
     except Exception as e:
         print(f"⚠️ Failed to initialize agent: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks."""
+    if cancel_listener is not None:
+        cancel_listener.cancel()
+    if session_purger is not None:
+        session_purger.cancel()
+    if warmer is not None:
+        await warmer.stop()
+    if agent is not None:
+        await agent.backends.stop_health_checks()
+    if semantic_cache is not None:
+        semantic_cache.close()
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    """The model queue is too long for this request's priority: ask the client to come back."""
+    return JSONResponse(
+        {"detail": str(exc), "priority": exc.priority, "retry_after": exc.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request, exc: CircuitOpen):
+    """The model keeps failing; refuse at once rather than hang until it times out again."""
+    return JSONResponse(
+        {"detail": str(exc), "retry_after": exc.retry_after},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_handler(request, exc: DeadlineExceeded):
+    """A model call ran out of time."""
+    return JSONResponse({"detail": str(exc), "phase": exc.phase, "stage": exc.stage}, status_code=504)
+
+
+async def purge_sessions():
+    """Periodically drop expired sessions (and their SQLite rows) off the event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SESSION_PURGE_INTERVAL)
+        try:
+            await loop.run_in_executor(None, sessions.purge_expired)
+        except Exception as e:
+            print(f"⚠️ Session purge: {e}")
+
+
+async def listen_for_cancels():
+    """Apply cancels and supersedes that other workers recorded for generations streaming here."""
+    while True:
+        await asyncio.sleep(CANCEL_POLL_INTERVAL)
+        try:
+            for key, reason in state.take_cancels():
+                generations.cancel(key, reason)
+        except Exception as e:
+            print(f"⚠️ Cancel listener: {e}")
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Check API health and features."""
+    """Check API health and features; 503 until the model has been warmed up."""
     if agent is None:
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
-    return HealthResponse(
-        status="healthy",
+    if warmer is not None and not warmer.ready:
+        status = "warming"
+    else:
+        healthy = agent.backends.any_healthy() and agent.breaker.state != OPEN
+        status = "healthy" if healthy else "degraded"
+    health = HealthResponse(
+        status=status,
         model=agent.model_name,
-        features=["level-aware", "socratic-teaching", "code-review", "playground"]
+        features=["level-aware", "socratic-teaching", "code-review", "playground"],
+        backends=agent.backends.status(),
+        warmup=warmer.status() if warmer is not None else None,
+        circuit=agent.breaker.status()
     )
+    if status == "warming":
+        # Keep load balancers from routing learners here while the model is still cold
+        return JSONResponse(health.model_dump(), status_code=503)
+    return health
+
+
+def record_turn(session: Optional[Session], message: str, reply: str):
+    """Append a finished exchange to the session transcript."""
+    if session is not None:
+        session.append("user", message)
+        session.append("assistant", reply)
+        sessions.save(session)
+
+
+async def chat_turn(message: str, session: Optional[Session], history: Optional[list[dict]],
+                    user_level: Optional[str], generation_id: str, routed: RoutedIntent = None) -> AsyncIterator[dict]:
+    """Stream one chat answer as events: {"content"} and {"phase": PhaseEvent}..., then {"done"},
+    {"cancelled", "reason"} or {"error"}. Shared by the SSE and WebSocket transports.
+    
+    A new turn in the same session supersedes this one; the generation can also be cancelled
+    by `generation_id` from any worker.
+    """
+    handle = generations.start(generation_id, session.session_id if session else None)
+    state.generation_started(handle.keys)
+    try:
+        parts = []
+        stream = agent.chat_stream(message, history, user_level=user_level, routed=routed)
+        async for chunk in coalesce(stream, STREAM_FLUSH_BYTES, STREAM_FLUSH_MS / 1000, handle.cancelled):
+            if isinstance(chunk, PhaseEvent):
+                # Cards are UI state; only the prose goes into the transcript the model sees
+                yield {"phase": chunk}
+                continue
+            parts.append(chunk)
+            yield {"content": chunk}
+        if handle.cancelled.is_set():
+            yield {"cancelled": True, "reason": handle.reason}
+            return
+        record_turn(session, message, "".join(parts))
+        yield {"done": True}
+    except (Overloaded, CircuitOpen) as e:
+        yield {"error": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        yield {"error": str(e)}
+    finally:
+        generations.finish(handle)
+        # Keys a newer generation in this process has taken over stay claimed
+        state.generation_finished(tuple(k for k in handle.keys if k not in generations))
 
 
 @app.post("/chat")
@@ -90,22 +397,45 @@ async def chat(request: ChatRequest):
     if agent is None:
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
-    history = None
-    if request.history:
-        history = [{"role": msg.role, "content": msg.content} for msg in request.history]
+    session = None
+    user_level = request.user_level
+    if request.session_id:
+        session = sessions.get(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        if user_level:
+            session.user_level = user_level
+        user_level = session.user_level
+        # Snapshot so the turn being generated isn't visible to the agent as history
+        history = list(session.history)
+    else:
+        history = None
+        if request.history:
+            history = [{"role": msg.role, "content": msg.content} for msg in request.history]
+    
+    # Model calls are queued fairly per session (per request without one)
+    flow = session.session_id if session else None
     
     if request.stream:
+        # Refuse before streaming starts, while a 429 (or 503) can still be sent
+        routed = await agent.admit_turn(request.message, history, user_level)
+        # A new message in the same session supersedes any answer still streaming.
+        # Client disconnects cancel the response task, which aborts the model call too.
+        # The id to cancel by is ours, never a client-chosen X-Request-ID another client could reuse.
+        generation_id = uuid.uuid4().hex
+        
         async def generate():
-            try:
-                async for chunk in agent.chat_stream(
-                    request.message, 
-                    history, 
-                    user_level=request.user_level
-                ):
-                    yield f"data: {json.dumps({'content': chunk})}\n\n"
-                yield f"data: {json.dumps({'done': True})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            set_flow(flow)
+            opening = {"generation_id": generation_id}
+            if session is not None:
+                opening["session_id"] = session.session_id
+            yield f"data: {json.dumps(opening)}\n\n"
+            async for event in chat_turn(request.message, session, history, user_level, generation_id, routed):
+                if "phase" in event:
+                    # Its own event type, already serialized
+                    yield f"event: phase\ndata: {event['phase'].data}\n\n"
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
         
         return StreamingResponse(
             generate(),
@@ -113,16 +443,189 @@ async def chat(request: ChatRequest):
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Generation-ID": generation_id,
             }
         )
     else:
+        set_flow(flow)
         try:
-            response = agent.chat(request.message, history)
-            return ChatResponse(response=response)
+            response = await agent.achat(request.message, history, user_level=user_level)
+            record_turn(session, request.message, response)
+            return ChatResponse(
+                response=response,
+                session_id=session.session_id if session else None
+            )
+        except (Overloaded, CircuitOpen, DeadlineExceeded):
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/{generation_id}/cancel")
+async def cancel_chat(generation_id: str):
+    """Abort a streaming answer by its generation id (X-Generation-ID) or session id."""
+    if not generations.cancel(generation_id) and not state.request_cancel(generation_id, "requested"):
+        raise HTTPException(status_code=404, detail="No active generation with that id")
+    return {"cancelled": True}
+
+
+def _socket_frame(turn_id: str, event: dict) -> Union[dict, str]:
+    """chat_turn event -> WebSocket frame (phase frames are spliced from the serialized payload)."""
+    if "phase" in event:
+        return f'{{"type":"phase","id":{json.dumps(turn_id)},"data":{event["phase"].data}}}'
+    if "content" in event:
+        return {"type": "token", "id": turn_id, "content": event["content"]}
+    if event.get("done"):
+        return {"type": "done", "id": turn_id}
+    if event.get("cancelled"):
+        return {"type": "cancelled", "id": turn_id, "reason": event.get("reason")}
+    return {"type": "error", "id": turn_id, **event}
+
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = None):
+    """One connection per learner, bound to a server-side session; turns send only the new
+    message and are multiplexed by a client-chosen id.
+    
+    Client frames: {"type": "chat", "id", "message", "user_level"?},
+    {"type": "review", "id", "code", "context"?, "user_level"?, "bypass_cache"?} and
+    {"type": "cancel", "id"}.
+    
+    An unknown or expired `session_id` gets an error frame and close code 4404.
+    
+    Server frames: {"type": "session", "session_id", "user_level", "resumed"} on connect, then per
+    turn any number of {"type": "token", "id", "content"}, {"type": "phase", "id", "data"} or
+    {"type": "feedback", "id", "item"}, ending with exactly one of {"type": "done"},
+    {"type": "cancelled", "reason"} or {"type": "error", "error", "retry_after"?}. A review's "done" carries its full "feedback".
+    """
+    await websocket.accept()
+    if agent is None:
+        await websocket.close(code=1013, reason="Agent not initialized")
+        return
+    session = sessions.get(session_id) if session_id else None
+    if session_id and session is None:
+        # Carrying on in a fresh session would silently drop the conversation so far; the client
+        # continues over HTTP with its own transcript instead
+        await websocket.send_text(json.dumps({"type": "error", "id": None, "error": "Session not found or expired"}))
+        await websocket.close(code=SESSION_EXPIRED_CLOSE, reason="Session not found or expired")
+        return
+    resumed = session is not None
+    if session is None:
+        session = sessions.create()
+    trace_id = current_trace().trace_id
+    # Server-chosen, so one client's turn ids can't address another connection's generations
+    connection_id = uuid.uuid4().hex
+    turns: dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+    
+    async def send(frame: Union[dict, str]):
+        async with send_lock:
+            try:
+                await websocket.send_text(frame if isinstance(frame, str) else json.dumps(frame))
+            except (WebSocketDisconnect, RuntimeError):
+                # Socket already closed; the receive loop cleans up the turns
+                pass
+    
+    def generation_id(turn_id: str) -> str:
+        return f"{connection_id}.{turn_id}"
+    
+    async def run_chat(turn_id: str, frame: dict):
+        nonlocal session
+        # Reload: with several workers another one may have advanced the transcript
+        session = sessions.get(session.session_id) or session
+        if frame.get("user_level"):
+            session.user_level = frame["user_level"]
+        message, history = str(frame.get("message", "")), list(session.history)
+        routed = await agent.admit_turn(message, history, session.user_level)
+        async for event in chat_turn(message, session, history, session.user_level, generation_id(turn_id), routed):
+            await send(_socket_frame(turn_id, event))
+    
+    async def run_review(turn_id: str, frame: dict):
+        feedback = []
+        async for item in agent.astream_review(str(frame.get("code", "")),
+                                               frame.get("context") or "User submitted code for review",
+                                               frame.get("user_level") or session.user_level or "beginner",
+                                               use_cache=not frame.get("bypass_cache")):
+            feedback.append(item)
+            await send({"type": "feedback", "id": turn_id, "item": item})
+        await send({"type": "done", "id": turn_id, "feedback": feedback})
+    
+    async def run_turn(turn_id: str, frame: dict, runner):
+        # Each turn gets its own trace (queue-wait metrics start from the turn, not the connection)
+        start_trace(f"{trace_id}.{turn_id}")
+        set_flow(session.session_id)
+        # ...and its own deadline
+        start_deadline(REQUEST_DEADLINE)
+        try:
+            await runner(turn_id, frame)
+        except asyncio.CancelledError:
+            await send({"type": "cancelled", "id": turn_id, "reason": "requested"})
+        except (Overloaded, CircuitOpen) as e:
+            await send({"type": "error", "id": turn_id, "error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            await send({"type": "error", "id": turn_id, "error": str(e)})
+        finally:
+            turns.pop(turn_id, None)
+    
+    runners = {"chat": run_chat, "review": run_review}
+    try:
+        await send({"type": "session", "session_id": session.session_id,
+                    "user_level": session.user_level, "resumed": resumed})
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+                kind, turn_id = frame.get("type"), str(frame.get("id", ""))
+            except (ValueError, AttributeError):
+                await send({"type": "error", "id": None, "error": "Frames must be JSON objects"})
+                continue
+            if kind == "cancel":
+                task = turns.get(turn_id)
+                # Chat turns stop gracefully (partial answer discarded); reviews are just cancelled
+                if task is not None and not generations.cancel(generation_id(turn_id)):
+                    task.cancel()
+            elif kind not in runners or not turn_id:
+                await send({"type": "error", "id": turn_id or None, "error": f"Unknown frame type {kind!r} or missing id"})
+            elif turn_id in turns:
+                await send({"type": "error", "id": turn_id, "error": "A turn with this id is still running"})
+            elif len(turns) >= WS_MAX_TURNS:
+                await send({"type": "error", "id": turn_id, "error": f"At most {WS_MAX_TURNS} turns may run at once"})
+            else:
+                turns[turn_id] = asyncio.create_task(run_turn(turn_id, frame, runners[kind]))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(turns.values()):
+            task.cancel()
+
+
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session(request: SessionCreateRequest = None):
+    """Start a server-side conversation; later turns only send the new message."""
+    session = sessions.create(user_level=request.user_level if request else None)
+    return SessionResponse(session_id=session.session_id, user_level=session.user_level)
+
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    """Fetch a session's transcript."""
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return SessionResponse(
+        session_id=session.session_id,
+        user_level=session.user_level,
+        history=session.history
+    )
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Discard a session."""
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"deleted": True}
+
+
 @app.post("/review")
 async def review_code(request: CodeReviewRequest):
     """Review user-submitted code and provide educational feedback."""
@@ -130,16 +633,85 @@ async def review_code(request: CodeReviewRequest):
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
     try:
-        review = agent.review_code(
+        review = await agent.areview_code(
             request.code,
             request.context,
-            request.user_level
+            request.user_level,
+            use_cache=not request.bypass_cache
         )
         return review
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/review/batch")
+async def review_batch(request: BatchReviewRequest):
+    """Review many submissions at once, streaming one NDJSON line per result as it completes.
+    
+    Each line has `index`, `id`, `ok`, `queued_ms`, `elapsed_ms` and either `review` (a
+    CODE_REVIEW payload) or `error`. A final `{"done": true, ...}` line summarizes the batch.
+    """
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized")
+    if not request.items:
+        raise HTTPException(status_code=422, detail="Batch has no items")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+    
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    items = [
+        {"code": item.code, "context": item.context, "level": item.user_level, "use_cache": not item.bypass_cache}
+        for item in request.items
+    ]
+    
+    async def generate():
+        started = time.perf_counter()
+        failed = 0
+        async for result in agent.areview_batch(items, concurrency):
+            result["id"] = request.items[result["index"]].id
+            failed += not result["ok"]
+            yield json.dumps(result) + "\n"
+        yield json.dumps({
+            "done": True,
+            "total": len(items),
+            "succeeded": len(items) - failed,
+            "failed": failed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/review/cache")
+async def review_cache_stats():
+    """Review cache hit/miss counters."""
+    return review_cache.stats()
+
+
+@app.get("/semantic-cache")
+async def semantic_cache_stats():
+    """Semantic answer cache size and hit rate."""
+    if semantic_cache is None:
+        raise HTTPException(status_code=404, detail="Semantic cache is disabled (set CORTANA_SEMANTIC_CACHE)")
+    return semantic_cache.stats()
+
+
+@app.get("/scheduler")
+async def scheduler_status():
+    """Model-slot queue: depth, flows and expected wait per priority class."""
+    if agent is None:
+        raise HTTPException(status_code=503, detail="Agent not initialized")
+    return agent.scheduler.status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/levels")
 async def get_levels():
     """Get available learning levels."""
@@ -172,4 +744,5 @@ async def get_levels():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # Development server; use serve.py to run several workers
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,249 @@
+"""
+Prometheus-style metrics and per-request tracing for Cortana
+Dependency-free counters/gauges/histograms rendered in the Prometheus text format,
+plus a context-local trace that follows a request through OllamaAgent.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+import bisect
+import logging
+import threading
+import time
+import uuid
+
+
+logger = logging.getLogger("cortana.trace")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = ['%s="%s"' % (n, _escape(v)) for n, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Point-in-time value, either set directly or read from a callback at scrape time."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), callback: Callable[[], float] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        if self.callback is not None:
+            return [f"{self.name} {self.callback()}"]
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders the /metrics exposition."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = (), callback: Callable[[], float] = None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+
+PHASE_LABELS = ("phase", "level")
+
+TURNS = REGISTRY.counter("cortana_turns_total", "Chat turns by the chat_stream branch that handled them", PHASE_LABELS)
+TTFT = REGISTRY.histogram("cortana_ttft_seconds", "Time from LLM call to first streamed token", PHASE_LABELS, LATENCY_BUCKETS)
+GENERATION_TIME = REGISTRY.histogram("cortana_generation_seconds", "Total LLM generation time", PHASE_LABELS, LATENCY_BUCKETS)
+TOKENS_PER_SEC = REGISTRY.histogram("cortana_tokens_per_second", "Streamed chunks per second of generation", PHASE_LABELS, RATE_BUCKETS)
+STREAMED_TOKENS = REGISTRY.counter("cortana_streamed_tokens_total", "Chunks streamed from the model", PHASE_LABELS)
+QUEUE_WAIT = REGISTRY.histogram("cortana_queue_wait_seconds", "Time from request arrival until its LLM call was issued", PHASE_LABELS, LATENCY_BUCKETS)
+PROMPT_TOKENS = REGISTRY.histogram("cortana_prompt_tokens", "Estimated prompt size sent to the model", PHASE_LABELS, SIZE_BUCKETS)
+LLM_ERRORS = REGISTRY.counter("cortana_llm_errors_total", "LLM calls that raised", PHASE_LABELS)
+GENERATIONS_IN_FLIGHT = REGISTRY.gauge("cortana_generations_in_flight", "LLM calls currently holding a generation slot")
+GENERATIONS_CANCELLED = REGISTRY.counter("cortana_generations_cancelled_total", "LLM calls aborted before completion (disconnect, cancel, superseded)", PHASE_LABELS)
+TOKENS_SAVED = REGISTRY.counter("cortana_cancel_tokens_saved_total", "Estimated tokens not generated thanks to cancellation", PHASE_LABELS)
+GENERATIONS_COALESCED = REGISTRY.counter("cortana_generations_coalesced_total", "Generations saved by joining an identical in-flight one", PHASE_LABELS)
+SCHEDULER_WAIT = REGISTRY.histogram("cortana_scheduler_wait_seconds", "Time LLM calls spent queued for a model slot", ("priority",), LATENCY_BUCKETS)
+SCHEDULER_QUEUED = REGISTRY.gauge("cortana_scheduler_queued", "LLM calls waiting for a model slot", ("priority",))
+SCHEDULER_REJECTED = REGISTRY.counter("cortana_scheduler_rejected_total", "LLM calls refused because their queue-time budget would be exceeded", ("priority",))
+DEADLINES_EXCEEDED = REGISTRY.counter("cortana_deadlines_exceeded_total", "LLM calls abandoned at a deadline, by what they were waiting for (queue, first_token, generation)", ("phase", "stage"))
+CIRCUIT_REJECTED = REGISTRY.counter("cortana_circuit_rejected_total", "LLM calls refused at once because the circuit breaker was open", ("phase",))
+DEGRADED_RESPONSES = REGISTRY.counter("cortana_degraded_responses_total", "Responses served without the model because it was unavailable or too slow", ("kind", "reason"))
+PREFETCH = REGISTRY.counter("cortana_lesson_prefetch_total", "Speculative Step-1 lessons by outcome (started, skipped, hit, discarded, preempted, expired...)", ("outcome",))
+CURRICULUM_LOOKUPS = REGISTRY.counter("cortana_curriculum_lookups_total", "Step-1 lessons looked up in the precomputed curriculum", ("outcome",))
+REVIEW_LLM_CALLS_AVOIDED = REGISTRY.counter("cortana_review_llm_calls_avoided_total", "Reviews answered by the static prepass without calling the model", ("reason",))
+REVIEW_PARSE_FALLBACKS = REGISTRY.counter("cortana_review_parse_fallbacks_total", "Reviews whose model output failed to parse and used canned feedback", ("level",))
+REVIEW_PARSE_SALVAGED = REGISTRY.counter("cortana_review_parse_salvaged_total", "Reviews whose model output was cut short or malformed but still yielded feedback items", ("level",))
+
+
+@dataclass
+class Trace:
+    """Timeline of one request, shared by everything running in its context."""
+    trace_id: str
+    started: float = field(default_factory=time.perf_counter)
+    events: list[tuple[float, str, dict]] = field(default_factory=list)
+
+    def event(self, name: str, **fields):
+        offset = time.perf_counter() - self.started
+        self.events.append((offset, name, fields))
+        logger.debug("[%s] +%.3fs %s %s", self.trace_id, offset, name, fields)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("cortana_trace", default=None)
+
+
+def start_trace(trace_id: str = None) -> Trace:
+    """Begin a trace for the current request context."""
+    trace = Trace(trace_id=trace_id or uuid.uuid4().hex[:16])
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Trace:
+    """The active trace, or a throwaway one outside a request (scripts, tests)."""
+    trace = _current_trace.get()
+    if trace is None:
+        trace = start_trace()
+    return trace
+
+
+class TraceMiddleware:
+    """ASGI middleware: one trace per HTTP request, id echoed as X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id")
+        trace = start_trace(incoming.decode("latin-1")[:64] if incoming else None)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", trace.trace_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_id)
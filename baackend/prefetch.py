@@ -0,0 +1,150 @@
+"""
+Speculative lesson prefetch
+While the learner answers the diagnostic, the Step-1 lesson for the level they picked is
+generated in the background. If the diagnostic confirms that level the lesson is served
+from the buffer; otherwise it is thrown away.
+"""
+
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional
+import asyncio
+import time
+
+from metrics import PREFETCH
+
+
+class _Speculation:
+    """One background lesson generation and the chunks it has produced so far."""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: list[str] = []
+        self.done = False
+        self.failed = False
+        self.error: Optional[Exception] = None
+        self.created = time.monotonic()
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(source))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _run(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.failed = True
+            raise
+        except Exception as e:
+            # Nobody awaits the task: unclaimed, a failed speculation just becomes a miss;
+            # claimed, replay() raises it
+            self.failed = True
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    @property
+    def running(self) -> bool:
+        return not self.task.done()
+
+    def cancel(self):
+        self.task.cancel()
+
+    async def replay(self) -> AsyncIterator[str]:
+        """Everything generated so far at once, then the rest as it arrives. Raises whatever
+        cut the generation short, so a partial lesson never passes for a whole one."""
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    # Buffered output goes out as one chunk: the learner sees it instantly
+                    yield "".join(self.chunks[index:])
+                    index = len(self.chunks)
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            if not self.done:
+                self.cancel()
+
+
+class LessonPrefetcher:
+    """Bounded set of speculative lesson generations keyed on (topic, level).
+
+    `max_inflight` caps concurrent speculations, and `can_start` (e.g. "enough model slots
+    are idle") is consulted before each one. `preempt()` cancels an unclaimed speculation
+    so real requests never wait behind it.
+    """
+
+    def __init__(self, max_inflight: int = 1, ttl_seconds: float = 300.0, max_entries: int = 64,
+                 can_start: Callable[[], bool] = None):
+        self.max_inflight = max_inflight
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.can_start = can_start or (lambda: True)
+        self._entries: OrderedDict[tuple, _Speculation] = OrderedDict()
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, spec in list(self._entries.items()):
+            if now - spec.created > self.ttl_seconds:
+                self._drop(key, "expired")
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)), "evicted")
+
+    def _drop(self, key: tuple, outcome: str):
+        spec = self._entries.pop(key)
+        spec.cancel()
+        PREFETCH.inc(outcome=outcome)
+
+    def inflight(self) -> int:
+        return sum(1 for spec in self._entries.values() if spec.running)
+
+    def speculate(self, topic: str, level: str, factory: Callable[[], AsyncIterator[str]]) -> bool:
+        """Start generating the lesson for (topic, level) unless limits say otherwise."""
+        self._expire()
+        key = (topic, level)
+        if key in self._entries:
+            return False
+        if self.inflight() >= self.max_inflight or not self.can_start():
+            PREFETCH.inc(outcome="skipped")
+            return False
+        self._entries[key] = _Speculation(factory())
+        PREFETCH.inc(outcome="started")
+        return True
+
+    def has(self, topic: str, level: str) -> bool:
+        """Whether take() would return a lesson for (topic, level), without claiming it."""
+        self._expire()
+        spec = self._entries.get((topic, level))
+        return spec is not None and not spec.failed and not spec.task.cancelled()
+
+    def take(self, topic: str, level: str) -> Optional[AsyncIterator[str]]:
+        """Claim the lesson for (topic, level); speculations for other levels of the topic are discarded."""
+        self._expire()
+        for key in [k for k in self._entries if k[0] == topic and k[1] != level]:
+            self._drop(key, "discarded")
+        spec = self._entries.pop((topic, level), None)
+        if spec is None:
+            return None
+        if spec.failed or spec.task.cancelled():
+            PREFETCH.inc(outcome="failed")
+            return None
+        PREFETCH.inc(outcome="hit")
+        return spec.replay()
+
+    def preempt(self) -> bool:
+        """Cancel the oldest running speculation to free its model slot."""
+        for key, spec in self._entries.items():
+            if spec.running:
+                self._drop(key, "preempted")
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._entries)
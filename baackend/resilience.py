@@ -0,0 +1,223 @@
+"""
+Deadlines and a circuit breaker for model calls
+Every request carries a deadline, and each model call is bounded by its phase's
+time-to-first-token and total-generation limits, never running past the request's own.
+Calls that fail or answer too slowly trip a breaker. While it is open, calls are refused
+at once until a probe call succeeds, so a stalled Ollama degrades the service instead of
+piling up hung connections.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+import logging
+import math
+import time
+
+from metrics import CIRCUIT_REJECTED, DEADLINES_EXCEEDED, current_trace
+
+
+logger = logging.getLogger("cortana.resilience")
+
+# Seconds; "default" covers every phase not listed
+DEFAULT_TTFT = {"default": 30.0, "review": 45.0, "prefetch": 60.0, "curriculum": 120.0}
+DEFAULT_TOTAL = {"default": 120.0, "summary": 60.0, "review": 90.0, "prefetch": 180.0, "curriculum": 600.0}
+
+
+class DeadlineExceeded(Exception):
+    """A model call ran out of time. `by_request` if it was the request's deadline (which the
+    client may have shortened) rather than the phase's own limit that ran out."""
+
+    def __init__(self, phase: str, stage: str, seconds: float, by_request: bool = False):
+        super().__init__(f"Model call for {phase} timed out after {seconds:.0f}s waiting for {stage.replace('_', ' ')}")
+        self.phase = phase
+        self.stage = stage
+        self.by_request = by_request
+
+
+class CircuitOpen(Exception):
+    """The model backend is failing; the call was refused without trying it."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"The model is unavailable; retry in {max(1, math.ceil(retry_after))}s")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+_request_deadline: ContextVar[Optional[float]] = ContextVar("cortana_request_deadline", default=None)
+
+
+def start_deadline(seconds: Optional[float]):
+    """Give the calls made in this context `seconds` in total (None: only phase limits)."""
+    _request_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def parse_deadlines(spec: str, defaults: dict[str, float]) -> dict[str, float]:
+    """`defaults` overridden by a "default=30,review=45" style string."""
+    limits = dict(defaults)
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        phase, _, value = part.partition("=")
+        limits[phase.strip()] = float(value)
+    return limits
+
+
+@dataclass
+class CallDeadline:
+    """Absolute (monotonic) limits for one model call."""
+    phase: str
+    started: float
+    first_token_at: float
+    done_at: float
+    request_at: Optional[float] = None
+
+    def until_first_token(self) -> float:
+        return max(0.0, self.first_token_at - time.monotonic())
+
+    def until_done(self) -> float:
+        return max(0.0, self.done_at - time.monotonic())
+
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        """Count and build the error for a deadline missed while waiting for `stage`."""
+        DEADLINES_EXCEEDED.inc(phase=self.phase, stage=stage)
+        current_trace().event("deadline_exceeded", phase=self.phase, stage=stage)
+        limit = self.done_at if stage == "generation" else self.first_token_at
+        return DeadlineExceeded(self.phase, stage, time.monotonic() - self.started,
+                                by_request=self.request_at is not None and limit >= self.request_at)
+
+
+class PhaseDeadlines:
+    """Per-phase time-to-first-token and total limits, capped by the request's deadline."""
+
+    def __init__(self, ttft: dict[str, float] = None, total: dict[str, float] = None):
+        self.ttft = ttft or DEFAULT_TTFT
+        self.total = total or DEFAULT_TOTAL
+
+    def start(self, phase: str) -> CallDeadline:
+        now = time.monotonic()
+        done_at = now + self.total.get(phase, self.total["default"])
+        request = _request_deadline.get()
+        if request is not None:
+            done_at = min(done_at, request)
+        first_token_at = min(done_at, now + self.ttft.get(phase, self.ttft["default"]))
+        return CallDeadline(phase, now, first_token_at, done_at, request)
+
+    def longest_wait(self) -> float:
+        """The longest any call may legitimately wait on the model before its first byte."""
+        return max(self.ttft.values())
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # for the state gauge
+
+
+class CircuitBreaker:
+    """Trips after `failure_threshold` consecutive bad calls (errors, timeouts, or a first
+    token slower than `slow_call` seconds) and refuses calls for `cooldown` seconds. Then one
+    probe call is let through: success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, slow_call: float = 15.0, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_failure: Optional[str] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def check(self, phase: str = None):
+        """Raise CircuitOpen while calls are being refused (doesn't claim the probe)."""
+        if self.state == OPEN:
+            if phase is not None:
+                CIRCUIT_REJECTED.inc(phase=phase)
+            raise CircuitOpen(self.retry_after())
+
+    def allow(self, phase: str) -> bool:
+        """Admit a call or raise CircuitOpen. True if the call is the half-open probe, which
+        must end in `record_success`, `record_failure` or `abandon`."""
+        state = self.state
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        CIRCUIT_REJECTED.inc(phase=phase)
+        # A probe is already out; its outcome decides
+        raise CircuitOpen(self.retry_after() or min(self.cooldown, 5.0))
+
+    def record_success(self, latency: float = 0.0):
+        if latency > self.slow_call:
+            self.record_failure(f"slow response ({latency:.1f}s)")
+            return
+        self._probing = False
+        self.consecutive_failures = 0
+        if self.opened_at is not None:
+            logger.info("Model circuit closed")
+            self.opened_at = None
+
+    def record_first_token(self, latency: float) -> bool:
+        """A streamed call's first token. A slow one counts as a failure (False); a timely one
+        settles the half-open probe, but only the completed stream (`record_success`) resets the
+        failure count, so models that stall mid-answer still trip the breaker."""
+        if latency > self.slow_call:
+            self.record_failure(f"slow first token ({latency:.1f}s)")
+            return False
+        if self._probing:
+            self._probing = False
+            if self.opened_at is not None:
+                logger.info("Model circuit closed")
+                self.opened_at = None
+        return True
+
+    def record_failure(self, reason: str):
+        self.consecutive_failures += 1
+        self.last_failure = reason[:200]
+        probe, self._probing = self._probing, False
+        if probe or (self.opened_at is None and self.consecutive_failures >= self.failure_threshold):
+            logger.warning("Model circuit open for %.0fs: %s", self.cooldown, self.last_failure)
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """The probe was cancelled before it told us anything; let another call probe."""
+        self._probing = False
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after_s": round(self.retry_after(), 1),
+            "last_failure": self.last_failure,
+        }
+
+
+class DeadlineMiddleware:
+    """ASGI middleware: each HTTP request gets `seconds` for its model calls, which a client
+    may shorten with an X-Request-Timeout header. WebSocket turns set their own."""
+
+    def __init__(self, app, seconds: Optional[float]):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            seconds = self.seconds
+            requested = dict(scope.get("headers") or []).get(b"x-request-timeout")
+            try:
+                if requested is not None and float(requested) > 0:
+                    seconds = min(seconds, float(requested)) if seconds else float(requested)
+            except ValueError:
+                pass
+            start_deadline(seconds)
+        await self.app(scope, receive, send)
@@ -0,0 +1,117 @@
+"""
+Content-addressed cache for code reviews
+Keys on a hash of the normalized source so whitespace/comment-only resubmissions hit
+"""
+
+from collections import OrderedDict
+from typing import Optional
+import ast
+import hashlib
+import json
+import os
+import re
+import threading
+
+
+def normalize_code(code: str) -> str:
+    """Canonical form of a submission: AST dump for Python, whitespace-normalized text otherwise.
+    
+    Both keep line positions, since cached reviews quote line numbers.
+    """
+    try:
+        tree = ast.parse(code)
+        for node in ast.walk(tree):
+            # Lines matter, columns don't: `x+1` and `x + 1` (or 2- vs 4-space indents) share a review
+            if hasattr(node, "col_offset"):
+                node.col_offset = node.end_col_offset = None
+        return "py:" + ast.dump(tree, include_attributes=True)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        # Not Python, or nested too deeply for the parser
+        pass
+    return "txt:" + "\n".join(re.sub(r"\s+", " ", line).strip() for line in code.splitlines())
+
+
+def review_key(code: str, context: str, level: str) -> str:
+    """Cache key for a (code, context, level) review."""
+    h = hashlib.sha256()
+    for part in (normalize_code(code), context or "", level or ""):
+        h.update(part.encode())
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class ReviewCache:
+    """Size-bounded LRU of CODE_REVIEW payloads with an optional on-disk tier."""
+
+    def __init__(self, max_entries: int = 1024, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _remember(self, key: str, review: dict):
+        self._entries[key] = review
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Look up a review, promoting disk hits into memory."""
+        with self._lock:
+            review = self._entries.get(key)
+            if review is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return review
+            if self.disk_dir:
+                try:
+                    with open(self._path(key), encoding="utf-8") as f:
+                        review = json.load(f)
+                except (OSError, ValueError):
+                    review = None
+                if review is not None:
+                    self._remember(key, review)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return review
+            self.misses += 1
+            return None
+
+    def __contains__(self, key: str) -> bool:
+        """Whether `key` would hit (without counting or promoting it)."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._path(key))
+
+    def put(self, key: str, review: dict):
+        """Store a review in memory and, if configured, on disk."""
+        with self._lock:
+            self._remember(key, review)
+        if self.disk_dir:
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(review, f)
+                os.replace(tmp, self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,126 @@
+"""
+Incremental parser for streamed review feedback
+Pulls each feedback object out of the model's JSON array as soon as its closing brace
+arrives, tolerating surrounding prose, code fences, a {"feedback": [...]} wrapper and
+truncated output.
+"""
+
+from typing import Optional
+import json
+
+
+FEEDBACK_TYPES = ("hint", "error", "improvement", "question")
+
+
+def normalize_item(item) -> Optional[dict]:
+    """Coerce one parsed element into a {type, message, line} feedback item (or drop it)."""
+    if isinstance(item, str):
+        item = {"type": "hint", "message": item}
+    if not isinstance(item, dict) or not isinstance(item.get("message"), str) or not item["message"].strip():
+        return None
+    feedback = {
+        "type": item.get("type") if item.get("type") in FEEDBACK_TYPES else "hint",
+        "message": item["message"].strip(),
+    }
+    line = item.get("line")
+    if isinstance(line, int) or (isinstance(line, str) and line.isdigit()):
+        feedback["line"] = int(line)
+    return feedback
+
+
+class FeedbackParser:
+    """Feed model output chunk by chunk; get back the feedback items completed so far.
+
+    The first array that directly contains an object is taken to be the feedback list.
+    Items are yielded as they close, so a response cut off mid-array keeps everything
+    before the cut.
+    """
+
+    def __init__(self):
+        self._buffer: list[str] = []
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._item_start: Optional[int] = None
+        self._item_chars: list[str] = []
+        self._target_depth: Optional[int] = None
+        self.items = 0
+        self.complete = False
+
+    def feed(self, text: str) -> list[dict]:
+        """Consume a chunk and return the items it completed."""
+        done = []
+        self._buffer.append(text)
+        for ch in text:
+            if self._item_start is not None:
+                self._item_chars.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                # Quotes only matter inside JSON; prose around it is skipped
+                if self._stack:
+                    self._in_string = True
+            elif ch in "[{":
+                if ch == "{" and self._stack and self._stack[-1] == "[" and self._item_start is None:
+                    if self._target_depth is None:
+                        self._target_depth = len(self._stack)
+                    if len(self._stack) == self._target_depth:
+                        self._item_start = len(self._stack)
+                        self._item_chars = ["{"]
+                self._stack.append(ch)
+            elif ch in "]}":
+                if not self._stack or self._stack[-1] != ("[" if ch == "]" else "{"):
+                    # Mismatched bracket: the surrounding text wasn't JSON after all
+                    self._stack.clear()
+                    self._item_start = None
+                    continue
+                self._stack.pop()
+                if ch == "}" and self._item_start is not None and len(self._stack) == self._item_start:
+                    item = self._decode("".join(self._item_chars))
+                    self._item_start = None
+                    if item is not None:
+                        self.items += 1
+                        done.append(item)
+                elif ch == "]" and self._target_depth is not None and len(self._stack) == self._target_depth - 1:
+                    self.complete = True
+        return done
+
+    def finish(self) -> list[dict]:
+        """Salvage what only a whole-response parse can give: an empty or all-string array,
+        or a single bare object."""
+        if self.items or self.complete:
+            return []
+        try:
+            value = json.loads("".join(self._buffer).strip())
+        except ValueError:
+            return []
+        if isinstance(value, dict) and isinstance(value.get("feedback"), list):
+            value = value["feedback"]
+        if isinstance(value, list):
+            self.complete = True
+        else:
+            value = [value]
+        items = [item for item in map(normalize_item, value) if item is not None]
+        self.items += len(items)
+        return items
+
+    @staticmethod
+    def _decode(text: str) -> Optional[dict]:
+        try:
+            return normalize_item(json.loads(text))
+        except ValueError:
+            return None
+
+
+def parse_feedback(content: str) -> tuple[list[dict], bool]:
+    """Parse a whole response: (items, complete)."""
+    parser = FeedbackParser()
+    items = parser.feed(content)
+    items.extend(parser.finish())
+    return items, parser.complete
@@ -0,0 +1,252 @@
+"""
+Weighted fair-share scheduling of model calls
+Every LLM call waits here for a generation slot. Priority classes share the slots by weight
+(interactive teaching ahead of reviews ahead of background work), learners within a class
+take turns, and calls whose expected wait exceeds their class's queue-time budget are
+refused up front so the API can answer 429 instead of timing out.
+"""
+
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
+import math
+import time
+
+from metrics import SCHEDULER_QUEUED, SCHEDULER_REJECTED, SCHEDULER_WAIT, current_trace
+from shared_state import Slots
+
+
+INTERACTIVE, REVIEW, BACKGROUND = "interactive", "review", "background"
+
+# Phases that aren't interactive tutoring; everything else (teach, lesson, summary, chat) is
+PHASE_PRIORITIES = {
+    "review": REVIEW,
+    "prefetch": BACKGROUND,
+    "curriculum": BACKGROUND,
+}
+
+
+@dataclass
+class PriorityClass:
+    """Share of the slots under contention, and how long a call may expect to queue
+    before it is refused (None: never refused)."""
+    weight: float
+    budget: Optional[float] = None
+
+
+DEFAULT_CLASSES = {
+    INTERACTIVE: PriorityClass(weight=8, budget=15.0),
+    REVIEW: PriorityClass(weight=2, budget=60.0),
+    BACKGROUND: PriorityClass(weight=1),
+}
+
+
+class Overloaded(Exception):
+    """The call would wait longer than its queue-time budget."""
+
+    def __init__(self, priority: str, expected_wait: float):
+        super().__init__(f"Model queue is full for {priority} requests (expected wait {expected_wait:.0f}s)")
+        self.priority = priority
+        self.expected_wait = expected_wait
+        self.retry_after = max(1, math.ceil(expected_wait))
+
+
+_flow: ContextVar[Optional[str]] = ContextVar("cortana_flow", default=None)
+_priority: ContextVar[Optional[str]] = ContextVar("cortana_priority", default=None)
+
+
+def set_flow(flow: Optional[str]):
+    """Who the calls in this context are made for (a session id); defaults to the request id."""
+    _flow.set(flow)
+
+
+def set_priority(priority: Optional[str]):
+    """Override the phase-derived priority for calls made in this context (e.g. batch reviews)."""
+    _priority.set(priority)
+
+
+def priority_for(phase: str) -> str:
+    return _priority.get() or PHASE_PRIORITIES.get(phase, INTERACTIVE)
+
+
+def current_flow() -> str:
+    return _flow.get() or current_trace().trace_id
+
+
+def parse_classes(weights: str = "", budgets: str = "") -> dict[str, PriorityClass]:
+    """DEFAULT_CLASSES overridden by "interactive=8,review=2" style strings (budget "none" disables)."""
+    classes = {name: PriorityClass(c.weight, c.budget) for name, c in DEFAULT_CLASSES.items()}
+    for spec, attr in ((weights, "weight"), (budgets, "budget")):
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            name, _, value = part.partition("=")
+            if name.strip() not in classes:
+                raise ValueError(f"Unknown priority class: {name!r}")
+            value = value.strip().lower()
+            setattr(classes[name.strip()], attr, None if value in ("", "none") else float(value))
+    return classes
+
+
+class _Waiter:
+    __slots__ = ("priority", "flow", "future", "enqueued")
+
+    def __init__(self, priority: str, flow: str):
+        self.priority = priority
+        self.flow = flow
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class FairScheduler:
+    """Orders waiters for a set of `Slots`.
+
+    Classes are served by stride scheduling: each grant advances the class's pass by
+    1/weight and the backlogged class with the lowest pass goes next, so with weights 8:2:1
+    interactive calls get 8 of every 11 slots under contention and nothing starves. Within a
+    class, flows (sessions, or one batch) are served round-robin, one call at a time.
+    """
+
+    def __init__(self, slots: Slots, classes: dict[str, PriorityClass] = None, service_time: float = 2.0):
+        self.slots = slots
+        self.classes = classes or DEFAULT_CLASSES
+        self._queues: dict[str, OrderedDict[str, deque[_Waiter]]] = {name: OrderedDict() for name in self.classes}
+        self._pass = {name: 0.0 for name in self.classes}
+        self._virtual = 0.0  # pass of the most recent grant
+        self._queued = {name: 0 for name in self.classes}
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Running average of how long a call holds its slot, for wait estimates
+        self.service_time = service_time
+        self.running = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.slots.capacity
+
+    def queued(self, priority: str = None) -> int:
+        return self._queued[priority] if priority else sum(self._queued.values())
+
+    def expected_wait(self, priority: str) -> float:
+        """Rough wait for a new call: everything queued at this priority or above drains
+        `capacity` calls per average service time."""
+        rank = list(self.classes).index(priority)
+        ahead = sum(self._queued[name] for name in list(self.classes)[:rank + 1])
+        if ahead == 0 and self.slots.available() > 0:
+            return 0.0
+        return (ahead + 1) * self.service_time / self.capacity
+
+    def admit(self, priority: str):
+        """Raise Overloaded if a call at this priority shouldn't be queued right now."""
+        budget = self.classes[priority].budget
+        if budget is None:
+            return
+        wait = self.expected_wait(priority)
+        if wait > budget:
+            SCHEDULER_REJECTED.inc(priority=priority)
+            raise Overloaded(priority, wait)
+
+    @asynccontextmanager
+    async def slot(self, priority: str, flow: str, timeout: Optional[float] = None):
+        """Hold one generation slot for the body of the block. Raises TimeoutError if none is
+        granted within `timeout` seconds."""
+        self.admit(priority)
+        waiter = _Waiter(priority, flow)
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we were cancelled: give the slot back
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            raise
+        wait = time.monotonic() - waiter.enqueued
+        SCHEDULER_WAIT.observe(wait, priority=priority)
+        if wait > 0.001:
+            current_trace().event("scheduled", priority=priority, wait_ms=round(wait * 1000, 1))
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_time = 0.9 * self.service_time + 0.1 * (time.monotonic() - start)
+            self._release()
+
+    def _enqueue(self, waiter: _Waiter):
+        flows = self._queues[waiter.priority]
+        if not self._queued[waiter.priority]:
+            # A class that was idle doesn't bank credit for the time it had nothing queued
+            self._pass[waiter.priority] = max(self._pass[waiter.priority], self._virtual)
+        flows.setdefault(waiter.flow, deque()).append(waiter)
+        self._count(waiter.priority, 1)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _remove(self, waiter: _Waiter):
+        flows = self._queues[waiter.priority]
+        queue = flows.get(waiter.flow)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del flows[waiter.flow]
+            self._count(waiter.priority, -1)
+
+    def _count(self, priority: str, delta: int):
+        self._queued[priority] += delta
+        SCHEDULER_QUEUED.set(self._queued[priority], priority=priority)
+
+    def _next(self) -> Optional[_Waiter]:
+        backlogged = [name for name in self.classes if self._queued[name]]
+        if not backlogged:
+            return None
+        priority = min(backlogged, key=lambda name: self._pass[name])
+        self._virtual = self._pass[priority]
+        self._pass[priority] += 1.0 / self.classes[priority].weight
+        flows = self._queues[priority]
+        flow, queue = next(iter(flows.items()))
+        waiter = queue.popleft()
+        if queue:
+            flows.move_to_end(flow)
+        else:
+            del flows[flow]
+        self._count(priority, -1)
+        return waiter
+
+    async def _dispatch(self):
+        """Take a slot, then hand it to whoever is next at that moment."""
+        while self.queued():
+            await self.slots.acquire()
+            waiter = self._next()
+            while waiter is not None and waiter.future.cancelled():
+                # Cancelled but not yet woken to dequeue itself
+                waiter = self._next()
+            if waiter is None:
+                self.slots.release()
+                return
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def _release(self):
+        self.running -= 1
+        self.slots.release()
+
+    def status(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "running": self.running,
+            "service_time_s": round(self.service_time, 3),
+            "classes": {
+                name: {
+                    "weight": c.weight,
+                    "budget_s": c.budget,
+                    "queued": self._queued[name],
+                    "flows": len(self._queues[name]),
+                    "expected_wait_s": round(self.expected_wait(name), 2),
+                }
+                for name, c in self.classes.items()
+            },
+        }
@@ -0,0 +1,383 @@
+"""
+Semantic cache for first-turn answers
+Learners ask the same question in endless phrasings ("what is recursion", "explain recursion
+to me"). First-turn questions are embedded and matched against an in-process vector index;
+an answer given earlier to a close enough question at the same level is served instead of
+generating a new one, and every fresh answer seeds the index.
+
+Opt-in (CORTANA_SEMANTIC_CACHE). NumPy is only imported when it is enabled.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from curriculum import normalize_topic
+from metrics import REGISTRY, current_trace
+
+
+logger = logging.getLogger("cortana.semantic_cache")
+
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+
+LOOKUPS = REGISTRY.counter("cortana_semantic_cache_lookups_total", "First-turn questions looked up in the semantic cache", ("kind", "level", "outcome"))
+SIMILARITY = REGISTRY.histogram("cortana_semantic_cache_similarity", "Cosine similarity of the nearest cached question (tune thresholds with this)", ("kind", "level"), SIMILARITY_BUCKETS)
+EVICTIONS = REGISTRY.counter("cortana_semantic_cache_evictions_total", "Cached answers evicted to make room")
+
+# Stricter for advanced learners, whose questions hinge on details a paraphrase can change
+DEFAULT_THRESHOLDS = {"beginner": 0.90, "intermediate": 0.93, "advanced": 0.96}
+
+
+def parse_thresholds(spec: str = "") -> dict[str, float]:
+    """DEFAULT_THRESHOLDS overridden by a "beginner=0.9,advanced=0.97" style string."""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        level, _, value = part.partition("=")
+        if level.strip() not in thresholds:
+            raise ValueError(f"Unknown level: {level!r}")
+        thresholds[level.strip()] = float(value)
+    return thresholds
+
+
+# Languages a question asks about. normalize_topic drops "in python" so curriculum lessons match,
+# but a cached answer is only right for the language it was written in.
+_LANGUAGES = re.compile(r"\b(python|javascript|js|typescript|java|c\+\+|cpp|c#|csharp|rust|golang|ruby|kotlin|swift|php)(?![\w+#])"
+                        r"|\b(?:in|using) (c|go)\b")
+_LANGUAGE_ALIASES = {"js": "javascript", "cpp": "c++", "csharp": "c#", "golang": "go"}
+
+
+def mentioned_languages(question: str) -> str:
+    """Programming languages named in `question`, canonical and "+"-joined ("" if none)."""
+    found = {_LANGUAGE_ALIASES.get(name, name)
+             for match in _LANGUAGES.finditer((question or "").lower()) for name in match.groups() if name}
+    return "+".join(sorted(found))
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class Embedder:
+    """Text -> unit-length float32 vector. `name` keys the on-disk index, so two embedders
+    never share one."""
+
+    name: str
+
+    async def aembed(self, text: str) -> np.ndarray:
+        raise NotImplementedError
+
+
+_WORD = re.compile(r"[\w+#]+")
+_STOP_WORDS = frozenset("a an the to me my i you it is are do does of in on for and or with about please".split())
+
+
+class HashingEmbedder(Embedder):
+    """Feature-hashed words, word pairs and character trigrams of the normalized question.
+
+    No model and fully deterministic (the same vector in every process), so it doubles as
+    the test stub. It catches rewordings around the same key terms, not synonyms.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hash{dim}"
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % self.dim
+        vector[index] += weight if digest[4] & 1 else -weight
+
+    def embed(self, text: str) -> np.ndarray:
+        words = [w for w in _WORD.findall(normalize_topic(text)) if w not in _STOP_WORDS]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in words:
+            self._add(vector, "w:" + word, 1.0)
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                self._add(vector, "c:" + padded[i:i + 3], 0.25)
+        for first, second in zip(words, words[1:]):
+            self._add(vector, f"b:{first} {second}", 0.5)
+        return _unit(vector)
+
+    async def aembed(self, text: str) -> np.ndarray:
+        return self.embed(text)
+
+
+class OllamaEmbedder(Embedder):
+    """A local embedding model served by Ollama (e.g. nomic-embed-text)."""
+
+    def __init__(self, model: str, base_url: Optional[str] = None):
+        self.model = model
+        self.base_url = base_url
+        self.name = "ollama-" + re.sub(r"[^\w.-]", "_", model)
+        self._client = None
+
+    async def aembed(self, text: str) -> np.ndarray:
+        if self._client is None:
+            from langchain_ollama import OllamaEmbeddings
+            self._client = OllamaEmbeddings(model=self.model, **({"base_url": self.base_url} if self.base_url else {}))
+        return _unit(await self._client.aembed_query(text))
+
+
+def create_embedder(spec: str, base_url: Optional[str] = None) -> Embedder:
+    """"hash" / "hash:<dim>" for the hashing embedder, "ollama:<model>" for an Ollama model."""
+    kind, _, arg = spec.partition(":")
+    if kind == "hash":
+        return HashingEmbedder(int(arg) if arg else 512)
+    if kind == "ollama" and arg:
+        return OllamaEmbedder(arg, base_url)
+    raise ValueError(f"Unknown embedder: {spec!r}")
+
+
+class VectorIndex:
+    """Fixed number of rows, each a unit vector plus the entry it stands for, evicting the
+    least recently used row when full. Nearest-neighbour search is one matrix-vector product.
+
+    With a directory, vectors live in a memory-mapped `vectors.f32` and each row's entry in
+    `entries/<row>.json`. Only one process writes a directory; others that open it get a
+    private in-memory copy.
+    """
+
+    def __init__(self, capacity: int = 2048, directory: Optional[str] = None):
+        self.capacity = capacity
+        self.directory = directory
+        self.persistent = False
+        self.dim: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._buckets = np.full(capacity, -1, dtype=np.int32)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._entries: list[Optional[dict]] = [None] * capacity
+        self._bucket_ids: dict[str, int] = {}
+        self._size = 0  # rows ever filled; eviction starts once this reaches capacity
+        self._lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+
+    def _bucket_id(self, bucket: str) -> int:
+        return self._bucket_ids.setdefault(bucket, len(self._bucket_ids))
+
+    def _open(self, dim: int):
+        """Allocate (or map and load) the matrix once the vector size is known."""
+        self.dim = dim
+        if not self.directory:
+            self._vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+            return
+        os.makedirs(os.path.join(self.directory, "entries"), exist_ok=True)
+        self._lock_fd = os.open(os.path.join(self.directory, "index.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.persistent = True
+        except BlockingIOError:
+            logger.info("Semantic cache %s is in use by another process; keeping a private copy", self.directory)
+        header_path = os.path.join(self.directory, "index.json")
+        vectors_path = os.path.join(self.directory, "vectors.f32")
+        header = {"dim": dim, "capacity": self.capacity}
+        try:
+            with open(header_path, encoding="utf-8") as f:
+                compatible = json.load(f) == header
+        except (OSError, ValueError):
+            compatible = False
+        compatible = compatible and os.path.exists(vectors_path)
+        if not self.persistent:
+            self._vectors = (np.array(np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(self.capacity, dim)))
+                             if compatible else np.zeros((self.capacity, dim), dtype=np.float32))
+        else:
+            if not compatible:
+                for name in os.listdir(os.path.join(self.directory, "entries")):
+                    os.remove(os.path.join(self.directory, "entries", name))
+                with open(header_path, "w", encoding="utf-8") as f:
+                    json.dump(header, f)
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+" if compatible else "w+",
+                                      shape=(self.capacity, dim))
+        if compatible:
+            self._load()
+
+    def _load(self):
+        entries_dir = os.path.join(self.directory, "entries")
+        for name in os.listdir(entries_dir):
+            row = int(name[:-5]) if name.endswith(".json") and name[:-5].isdigit() else -1
+            if not 0 <= row < self.capacity:
+                continue
+            try:
+                with open(os.path.join(entries_dir, name), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # A crash between writing the row and its entry leaves them disagreeing
+            if not np.allclose(self._vectors[row, :len(entry["head"])], entry["head"], atol=1e-6):
+                continue
+            self._entries[row] = entry
+            self._buckets[row] = self._bucket_id(entry["bucket"])
+            self._last_used[row] = entry["created"]
+            self._size = max(self._size, row + 1)
+        logger.info("Loaded %d semantic cache entries from %s", len(self), self.directory)
+
+    def search(self, vector: np.ndarray, bucket: str) -> tuple[Optional[int], float]:
+        """Row of the most similar vector in `bucket` and its cosine similarity."""
+        with self._lock:
+            if self._vectors is None:
+                self._open(len(vector))
+            bucket_id = self._bucket_ids.get(bucket)
+            if bucket_id is None or not self._size or len(vector) != self.dim:
+                return None, 0.0
+            scores = np.asarray(self._vectors[:self._size] @ vector)
+            scores[self._buckets[:self._size] != bucket_id] = -1.0
+            row = int(np.argmax(scores))
+            if scores[row] <= -1.0:
+                return None, 0.0
+            # Unit vectors, so anything above 1 is rounding
+            return row, min(float(scores[row]), 1.0)
+
+    def get(self, row: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries[row]
+            if entry is not None:
+                self._last_used[row] = time.time()
+            return entry
+
+    def add(self, vector: np.ndarray, bucket: str, entry: dict) -> int:
+        """Store an entry under `vector`, evicting the least recently used row if full."""
+        with self._lock:
+            if self._vectors is None:
+                self._open(len(vector))
+            if len(vector) != self.dim:
+                raise ValueError(f"Vector has {len(vector)} dimensions, index has {self.dim}")
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used))
+                EVICTIONS.inc()
+            entry = dict(entry, bucket=bucket, created=time.time(), head=[float(x) for x in vector[:8]])
+            self._vectors[row] = vector
+            self._buckets[row] = self._bucket_id(bucket)
+            self._last_used[row] = entry["created"]
+            self._entries[row] = entry
+            if self.persistent:
+                path = os.path.join(self.directory, "entries", f"{row}.json")
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entry, f, separators=(",", ":"))
+                os.replace(tmp, path)
+            return row
+
+    def close(self):
+        with self._lock:
+            if isinstance(self._vectors, np.memmap) and self.persistent:
+                self._vectors.flush()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def __len__(self) -> int:
+        return sum(entry is not None for entry in self._entries[:self._size])
+
+
+@dataclass
+class Probe:
+    """Result of a lookup; pass it back to `store()` so the question isn't embedded twice."""
+    kind: str
+    level: str
+    question: str
+    partition: str = ""
+    vector: Optional[np.ndarray] = None
+    answer: Optional[str] = None
+    similarity: float = 0.0
+
+
+class SemanticCache:
+    """Answers to first-turn questions, looked up by meaning within (kind, level, language).
+
+    `kind` separates answers to different prompts for the same question ("lesson" after the
+    diagnostic, "teach" for a direct question). Each prompt version gets its own index under
+    `directory`, so editing the system prompt starts from empty.
+    """
+
+    def __init__(self, embedder: Embedder, capacity: int = 2048, directory: Optional[str] = None,
+                 thresholds: dict[str, float] = None):
+        self.embedder = embedder
+        self.capacity = capacity
+        self.base_directory = directory
+        self.thresholds = thresholds or DEFAULT_THRESHOLDS
+        self.index = VectorIndex(capacity)
+        self.hits = 0
+        self.misses = 0
+
+    def use_version(self, version: str):
+        """Bind to the prompt version the cached answers were generated with."""
+        directory = os.path.join(self.base_directory, f"{self.embedder.name}-{version}") if self.base_directory else None
+        self.index.close()
+        self.index = VectorIndex(self.capacity, directory)
+
+    def threshold(self, level: Optional[str]) -> float:
+        # Without a known level, only near-verbatim repeats are reused
+        return self.thresholds.get(level, max(self.thresholds.values()))
+
+    async def lookup(self, kind: str, question: str, level: Optional[str], peek: bool = False) -> Probe:
+        """Cached answer for a question close enough to `question`, in `probe.answer`.
+        `peek` checks without counting towards the hit rate."""
+        level = level or "none"
+        partition = f"{kind}|{level}"
+        languages = mentioned_languages(question)
+        if languages:
+            # "sort a list in python" must never answer "sort a list in java"
+            partition += "|" + languages
+        probe = Probe(kind, level, question, partition)
+        try:
+            probe.vector = await self.embedder.aembed(question)
+        except Exception as e:
+            # An unavailable embedding model just means generating as usual
+            if not peek:
+                LOOKUPS.inc(kind=kind, level=level, outcome="error")
+            logger.warning("Embedding failed: %s", e)
+            return probe
+        row, similarity = self.index.search(probe.vector, partition)
+        probe.similarity = similarity
+        entry = self.index.get(row) if row is not None and similarity >= self.threshold(level) else None
+        if entry is not None:
+            probe.answer = entry["answer"]
+        if not peek:
+            if row is not None:
+                SIMILARITY.observe(similarity, kind=kind, level=level)
+            LOOKUPS.inc(kind=kind, level=level, outcome="miss" if entry is None else "hit")
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                current_trace().event("semantic_cache_hit", kind=kind, similarity=round(similarity, 3))
+        return probe
+
+    def store(self, probe: Probe, answer: str):
+        """Seed the cache with a freshly generated answer to the probed question."""
+        if probe.vector is None or probe.answer is not None or not answer.strip():
+            return
+        self.index.add(probe.vector, probe.partition, {"question": probe.question, "answer": answer})
+
+    def close(self):
+        self.index.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "embedder": self.embedder.name,
+            "entries": len(self.index),
+            "capacity": self.capacity,
+            "persistent": self.index.persistent,
+            "thresholds": self.thresholds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.index)
@@ -0,0 +1,55 @@
+"""
+Production entry point: the API behind several uvicorn worker processes
+
+    cd baackend && python serve.py --workers 4 --port 8000
+
+With more than one worker, shared state (sessions, review cache, model slots, cancels) lives
+in --state-dir / CORTANA_STATE_DIR, defaulting to a directory under the system temp dir.
+Every worker must see the same directory, so all of them have to run on the same host.
+
+`--profile-startup` prints where boot time goes instead of serving; with `--startup-budget`
+it exits non-zero when a worker takes longer than that to become ready.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--state-dir", default=os.getenv("CORTANA_STATE_DIR"),
+                        help="directory for state shared between workers")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--profile-startup", action="store_true", help="report import and startup time, then exit")
+    parser.add_argument("--startup-budget", type=float, help="seconds; with --profile-startup, fail if exceeded")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from startup_profile import print_profile, profile
+        report = profile()
+        print_profile(report)
+        if args.startup_budget is not None and report["ready_s"] > args.startup_budget:
+            print(f"Startup took {report['ready_s']:.2f}s, over the {args.startup_budget:.2f}s budget")
+            sys.exit(1)
+        return
+
+    state_dir = args.state_dir
+    if args.workers > 1 and not state_dir:
+        state_dir = os.path.join(tempfile.gettempdir(), "cortana-state")
+    if state_dir:
+        # Workers are separate interpreters; they pick the directory up from the environment
+        os.environ["CORTANA_STATE_DIR"] = os.path.abspath(state_dir)
+        print(f"Shared state in {os.environ['CORTANA_STATE_DIR']} ({args.workers} workers)")
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                log_level=args.log_level, app_dir=os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+    main()
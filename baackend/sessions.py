@@ -0,0 +1,156 @@
+"""
+Server-side conversation sessions for Cortana
+In-memory LRU/TTL store with an optional SQLite persistence layer
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+@dataclass
+class Session:
+    """A single learner conversation."""
+    session_id: str
+    history: list[dict] = field(default_factory=list)
+    user_level: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def append(self, role: str, content: str):
+        """Record a turn in the conversation."""
+        self.history.append({"role": role, "content": content})
+        self.updated_at = time.time()
+
+
+class SessionStore:
+    """LRU + TTL session store, optionally backed by SQLite.
+
+    With `shared=True` several processes use the same database, so reads always go to
+    SQLite rather than trusting a possibly stale in-memory copy.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 6 * 3600, db_path: Optional[str] = None,
+                 shared: bool = False):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.shared = shared and bool(db_path)
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+            if self.shared:
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    history TEXT NOT NULL,
+                    user_level TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._db.commit()
+
+    def _expired(self, session: Session) -> bool:
+        return self.ttl_seconds > 0 and time.time() - session.updated_at > self.ttl_seconds
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        """Load a session from SQLite, if persistence is enabled."""
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT history, user_level, created_at, updated_at FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Session(
+            session_id=session_id,
+            history=json.loads(row[0]),
+            user_level=row[1],
+            created_at=row[2],
+            updated_at=row[3]
+        )
+
+    def _remember(self, session: Session):
+        """Insert into the in-memory tier, evicting the least recently used."""
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def create(self, user_level: Optional[str] = None) -> Session:
+        """Create and store a new session."""
+        session = Session(session_id=uuid.uuid4().hex, user_level=user_level)
+        with self._lock:
+            self._remember(session)
+        self.save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Fetch a live session, or None if unknown or expired."""
+        with self._lock:
+            session = None if self.shared else self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+                if session is None:
+                    return None
+            if self._expired(session):
+                self._sessions.pop(session_id, None)
+                self._delete_persisted(session_id)
+                return None
+            self._remember(session)
+            return session
+
+    def save(self, session: Session):
+        """Write a session through to SQLite, if persistence is enabled."""
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (session.session_id, json.dumps(session.history), session.user_level,
+                 session.created_at, session.updated_at)
+            )
+            self._db.commit()
+
+    def delete(self, session_id: str) -> bool:
+        """Remove a session. Returns True if it existed."""
+        with self._lock:
+            existed = self._sessions.pop(session_id, None) is not None
+            if self._db is not None:
+                existed = self._delete_persisted(session_id) or existed
+            return existed
+
+    def _delete_persisted(self, session_id: str) -> bool:
+        if self._db is None:
+            return False
+        cursor = self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        return cursor.rowcount > 0
+
+    def purge_expired(self) -> int:
+        """Drop every expired session. Returns how many were removed."""
+        if self.ttl_seconds <= 0:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            stale = [sid for sid, s in self._sessions.items() if s.updated_at < cutoff]
+            for sid in stale:
+                del self._sessions[sid]
+            removed = len(stale)
+            if self._db is not None:
+                cursor = self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+                self._db.commit()
+                removed = max(removed, cursor.rowcount)
+            return removed
+
+    def __len__(self) -> int:
+        return len(self._sessions)
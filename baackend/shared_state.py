@@ -0,0 +1,230 @@
+"""
+Shared state for multi-process deployments
+Everything worker processes have to agree on (sessions, the review cache, model-slot limits
+and cancellation) behind one interface, with an in-process implementation for a single
+worker and a SQLite + lock-file implementation for several.
+"""
+
+from typing import Optional
+import asyncio
+import fcntl
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from review_cache import ReviewCache
+from sessions import SessionStore
+
+
+class Slots:
+    """Counting limit on concurrent model calls, used as `async with slots:`."""
+
+    capacity: int
+
+    async def acquire(self):
+        raise NotImplementedError
+
+    def release(self):
+        raise NotImplementedError
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def available(self) -> int:
+        raise NotImplementedError
+
+    def locked(self) -> bool:
+        return self.available() == 0
+
+
+class LocalSlots(Slots):
+    """Slots for one process."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._semaphore = asyncio.Semaphore(capacity)
+        self._held = 0
+
+    async def acquire(self):
+        await self._semaphore.acquire()
+        self._held += 1
+
+    def release(self):
+        self._held -= 1
+        self._semaphore.release()
+
+    def available(self) -> int:
+        return self.capacity - self._held
+
+
+class FileLockSlots(Slots):
+    """Slots shared by every process on the host: one flock()ed file per slot.
+
+    The kernel drops a dead worker's locks, so a crash never leaks capacity. Waiters poll
+    with a short backoff (5-50 ms), which is negligible next to a model call.
+    """
+
+    def __init__(self, directory: str, name: str, capacity: int, poll: float = 0.005, max_poll: float = 0.05):
+        os.makedirs(directory, exist_ok=True)
+        self.capacity = capacity
+        self.poll = poll
+        self.max_poll = max_poll
+        self._fds = [os.open(os.path.join(directory, f"{name}.{i}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+                     for i in range(capacity)]
+        # flock() doesn't conflict within one open file, so this process tracks its own slots
+        self._mine: set[int] = set()
+
+    def _try_lock(self, index: int) -> bool:
+        try:
+            fcntl.flock(self._fds[index], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _try_acquire(self) -> Optional[int]:
+        start = random.randrange(self.capacity)
+        for offset in range(self.capacity):
+            index = (start + offset) % self.capacity
+            if index not in self._mine and self._try_lock(index):
+                self._mine.add(index)
+                return index
+        return None
+
+    async def acquire(self):
+        delay = self.poll
+        while self._try_acquire() is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll)
+
+    def release(self):
+        # Slots are interchangeable, so any one this process holds can be released
+        index = self._mine.pop()
+        fcntl.flock(self._fds[index], fcntl.LOCK_UN)
+
+    def available(self) -> int:
+        free = 0
+        for index in range(self.capacity):
+            if index not in self._mine and self._try_lock(index):
+                fcntl.flock(self._fds[index], fcntl.LOCK_UN)
+                free += 1
+        return free
+
+
+class SharedState:
+    """In-process state: the right choice for a single worker."""
+
+    kind = "local"
+
+    def session_store(self, max_sessions: int, ttl_seconds: float, db_path: Optional[str] = None) -> SessionStore:
+        return SessionStore(max_sessions=max_sessions, ttl_seconds=ttl_seconds, db_path=db_path)
+
+    def review_cache(self, max_entries: int, disk_dir: Optional[str] = None) -> ReviewCache:
+        return ReviewCache(max_entries=max_entries, disk_dir=disk_dir)
+
+    def slots(self, name: str, capacity: int) -> Slots:
+        return LocalSlots(capacity)
+
+    def generation_started(self, keys: tuple):
+        """Claim generation ids (request/session) for this process, superseding other owners."""
+
+    def generation_finished(self, keys: tuple):
+        pass
+
+    def request_cancel(self, key: str, reason: str) -> bool:
+        """Ask whichever process owns `key` to cancel it. False if nobody does."""
+        return False
+
+    def take_cancels(self) -> list[tuple[str, str]]:
+        """Cancellations other processes requested for generations owned here."""
+        return []
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SQLiteState(SharedState):
+    """State shared through a directory: SQLite for sessions and cancellation, files for the
+    review cache tier and slot locks. All workers on a host point at the same directory."""
+
+    kind = "sqlite"
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "state.db"), check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, pid INTEGER NOT NULL, started_at REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cancels (key TEXT NOT NULL, pid INTEGER NOT NULL, reason TEXT NOT NULL)")
+        self._db.commit()
+        self._purge_dead()
+
+    def _purge_dead(self):
+        with self._lock:
+            pids = {row[0] for row in self._db.execute("SELECT DISTINCT pid FROM generations")}
+            for pid in pids:
+                if not _alive(pid):
+                    self._db.execute("DELETE FROM generations WHERE pid = ?", (pid,))
+                    self._db.execute("DELETE FROM cancels WHERE pid = ?", (pid,))
+            self._db.commit()
+
+    def session_store(self, max_sessions: int, ttl_seconds: float, db_path: Optional[str] = None) -> SessionStore:
+        return SessionStore(max_sessions=max_sessions, ttl_seconds=ttl_seconds,
+                            db_path=db_path or os.path.join(self.directory, "sessions.db"), shared=True)
+
+    def review_cache(self, max_entries: int, disk_dir: Optional[str] = None) -> ReviewCache:
+        return ReviewCache(max_entries=max_entries, disk_dir=disk_dir or os.path.join(self.directory, "reviews"))
+
+    def slots(self, name: str, capacity: int) -> Slots:
+        return FileLockSlots(os.path.join(self.directory, "slots"), name, capacity)
+
+    def generation_started(self, keys: tuple):
+        pid = os.getpid()
+        with self._lock:
+            for key in keys:
+                row = self._db.execute("SELECT pid FROM generations WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] != pid:
+                    self._db.execute("INSERT INTO cancels VALUES (?, ?, ?)", (key, row[0], "superseded"))
+                self._db.execute("INSERT OR REPLACE INTO generations VALUES (?, ?, ?)", (key, pid, time.time()))
+            self._db.commit()
+
+    def generation_finished(self, keys: tuple):
+        with self._lock:
+            self._db.executemany("DELETE FROM generations WHERE key = ? AND pid = ?", [(k, os.getpid()) for k in keys])
+            self._db.commit()
+
+    def request_cancel(self, key: str, reason: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT pid FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None or not _alive(row[0]):
+                return False
+            self._db.execute("INSERT INTO cancels VALUES (?, ?, ?)", (key, row[0], reason))
+            self._db.commit()
+            return True
+
+    def take_cancels(self) -> list[tuple[str, str]]:
+        pid = os.getpid()
+        with self._lock:
+            rows = self._db.execute("SELECT key, reason FROM cancels WHERE pid = ?", (pid,)).fetchall()
+            if rows:
+                self._db.execute("DELETE FROM cancels WHERE pid = ?", (pid,))
+                self._db.commit()
+        return rows
+
+
+def create_state(directory: Optional[str] = None) -> SharedState:
+    """SQLite-backed state when a directory is configured, in-process state otherwise."""
+    return SQLiteState(directory) if directory else SharedState()
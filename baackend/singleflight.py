@@ -0,0 +1,124 @@
+"""
+Single-flight coalescing of identical in-flight generations
+The first caller for a key runs the generation; identical callers that arrive while it is
+running share its result, and streaming subscribers get a replay of chunks already emitted.
+"""
+
+from typing import AsyncIterator, Awaitable, Callable
+import asyncio
+import hashlib
+import json
+
+
+def flight_key(*parts) -> str:
+    """Stable key for a generation request (messages, model, parameters...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _StreamFlight:
+    """One shared streaming generation and its buffered output."""
+
+    def __init__(self, key: str, source: AsyncIterator[str], registry: dict):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: BaseException = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._key = key
+        self._registry = registry
+        registry[key] = self
+        self.task = asyncio.create_task(self._run(source))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _run(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.done = True
+            if self._registry.get(self._key) is self:
+                del self._registry[self._key]
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Replay everything emitted so far, then follow the live stream."""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            # Nobody is left to read it: abort the generation
+            if self.subscribers == 0 and not self.done:
+                self.task.cancel()
+
+
+class _CallFlight:
+    """One shared non-streaming call."""
+
+    def __init__(self, key: str, coro: Awaitable, registry: dict):
+        self.waiters = 0
+        self._key = key
+        self._registry = registry
+        registry[key] = self
+        self.task = asyncio.ensure_future(coro)
+        self.task.add_done_callback(self._forget)
+
+    def _forget(self, _task):
+        if self._registry.get(self._key) is self:
+            del self._registry[self._key]
+
+    async def join(self):
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if self.waiters == 0 and not self.task.done():
+                self.task.cancel()
+
+
+class SingleFlight:
+    """Registry of in-flight generations keyed on their exact inputs."""
+
+    def __init__(self):
+        self._streams: dict[str, _StreamFlight] = {}
+        self._calls: dict[str, _CallFlight] = {}
+
+    def is_active(self, key: str) -> bool:
+        """Whether a call for `key` would join an existing generation."""
+        flight = self._streams.get(key) or self._calls.get(key)
+        return flight is not None
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Subscribe to the streaming generation for `key`, starting it if needed."""
+        flight = self._streams.get(key)
+        if flight is None or flight.done:
+            flight = _StreamFlight(key, factory(), self._streams)
+        return flight.subscribe()
+
+    async def call(self, key: str, factory: Callable[[], Awaitable]):
+        """Await the non-streaming call for `key`, starting it if needed."""
+        flight = self._calls.get(key)
+        if flight is None or flight.task.done():
+            flight = _CallFlight(key, factory(), self._calls)
+        return await flight.join()
+
+    def in_flight(self) -> int:
+        return len(self._streams) + len(self._calls)
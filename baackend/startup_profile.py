@@ -0,0 +1,94 @@
+"""
+Startup-time report for the API
+Where a fresh worker spends its boot: import time per top-level package (from
+`python -X importtime`), then the startup phases, then the costs deferred to first use.
+
+    cd baackend && python serve.py --profile-startup [--startup-budget 1.5]
+"""
+
+from collections import defaultdict
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_breakdown(module: str = "main") -> dict[str, float]:
+    """Cumulative import seconds per package `module` pulls in, measured in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    # -X importtime lists children before their parent, so main's direct imports are the
+    # one-level-deep lines since the previous top-level line
+    children, packages = [], defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        depth = len(match.group(3)) // 2
+        if depth == 0:
+            if match.group(4) == module:
+                for name, seconds in children:
+                    packages[name.split(".")[0]] += seconds
+            children = []
+        elif depth == 1:
+            children.append((match.group(4), int(match.group(2)) / 1e6))
+    return dict(sorted(packages.items(), key=lambda item: -item[1]))
+
+
+def _timed(phases: dict, name: str, func):
+    start = time.perf_counter()
+    value = func()
+    phases[name] = time.perf_counter() - start
+    return value
+
+
+async def _startup(main, phases: dict):
+    start = time.perf_counter()
+    await main.startup_event()
+    phases["startup event"] = time.perf_counter() - start
+    agent = main.agent
+    if agent is not None:
+        # Paid by the first request that needs them, not at boot
+        _timed(phases, "first use: model client", agent.backends.preload)
+        _timed(phases, "first use: chat graph", lambda: agent.graph)
+    await main.shutdown_event()
+
+
+def profile() -> dict:
+    """Import breakdown and phase timings; `ready_s` is import + startup, the time before a
+    worker can answer requests."""
+    # The model needn't be up to measure boot; warm-up would only add network time
+    os.environ.setdefault("CORTANA_WARMUP", "0")
+    # A background preload would race the "first use" timing below
+    os.environ["CORTANA_PRELOAD_CLIENTS"] = "0"
+    packages = import_breakdown()
+    sys.path.insert(0, HERE)
+    phases = {}
+    main = _timed(phases, "import main", lambda: __import__("main"))
+    asyncio.run(_startup(main, phases))
+    return {
+        "packages": packages,
+        "phases": phases,
+        "ready_s": phases["import main"] + phases["startup event"],
+    }
+
+
+def print_profile(report: dict, top: int = 12):
+    print(f"{'imports (fresh interpreter)':<32} {'ms':>8}")
+    for package, seconds in list(report["packages"].items())[:top]:
+        print(f"  {package:<30} {seconds * 1000:>8.1f}")
+    print(f"{'phases':<32} {'ms':>8}")
+    for phase, seconds in report["phases"].items():
+        print(f"  {phase:<30} {seconds * 1000:>8.1f}")
+    print(f"{'ready to serve':<32} {report['ready_s'] * 1000:>8.1f}")
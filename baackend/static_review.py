@@ -0,0 +1,203 @@
+"""
+Static-analysis prepass for Python code reviews
+Finds syntax errors, undefined names, unreachable code and inescapable `while True` loops
+locally, as CODE_REVIEW feedback items ({type, message, line}), before the model is asked.
+"""
+
+from dataclasses import dataclass, field
+import ast
+import builtins
+import re
+
+
+_PY_HINTS = re.compile(
+    r"^\s*(def \w+\s*\(|class \w+|import \w+|from [\w.]+ import|elif\b|except\b|print\(|"
+    r"(if|for|while|with|try|else)\b.*:\s*(#.*)?$)",
+    re.MULTILINE,
+)
+_OTHER_HINTS = re.compile(
+    r"(#include\b|\bfunction\s+\w*\s*\(|\b(const|let|var)\s+\w+\s*=|\bpublic\s+(static\s+)?\w+|"
+    r"\bconsole\.log\b|\bSystem\.out\b|=>|;\s*$|\{\s*$)",
+    re.MULTILINE,
+)
+
+_BUILTINS = frozenset(dir(builtins)) | {"__name__", "__file__", "__doc__", "__builtins__", "__spec__"}
+
+
+@dataclass
+class Analysis:
+    """Outcome of the prepass."""
+    language: str
+    findings: list[dict] = field(default_factory=list)
+    hard_error: bool = False
+
+
+def looks_like_python(code: str) -> bool:
+    """Best-effort guess for code that may not even parse."""
+    return len(_PY_HINTS.findall(code)) > len(_OTHER_HINTS.findall(code))
+
+
+def _syntax_finding(error: SyntaxError) -> dict:
+    line = error.lineno or 1
+    if isinstance(error, IndentationError):
+        message = (f"Line {line} has an indentation problem ({error.msg}). "
+                   "Which lines are meant to sit inside the block above it?")
+    else:
+        message = (f"Python can't read line {line} ({error.msg}). "
+                   "Look closely at that line and the one before it: is something missing or extra?")
+    return {"type": "error", "message": message, "line": line}
+
+
+class _Bindings(ast.NodeVisitor):
+    """Every name the submission binds anywhere (scope-insensitive, so it never over-reports)."""
+
+    def __init__(self):
+        self.bound: set[str] = set()
+        self.star_import = False
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, (ast.Store, ast.Del)):
+            self.bound.add(node.id)
+
+    def _visit_def(self, node):
+        self.bound.add(node.name)
+        self.generic_visit(node)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _visit_def
+
+    def visit_arg(self, node: ast.arg):
+        self.bound.add(node.arg)
+
+    def visit_alias(self, node: ast.alias):
+        if node.name == "*":
+            self.star_import = True
+        else:
+            self.bound.add((node.asname or node.name).split(".")[0])
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self.bound.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bound.add(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.bound.add(node.name)
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.bound.add(node.rest)
+        self.generic_visit(node)
+
+
+def _undefined_names(tree: ast.AST) -> list[dict]:
+    bindings = _Bindings()
+    bindings.visit(tree)
+    if bindings.star_import:
+        return []
+    findings, seen = [], set()
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+                and node.id not in bindings.bound and node.id not in _BUILTINS and node.id not in seen):
+            seen.add(node.id)
+            findings.append({
+                "type": "error",
+                "message": f"`{node.id}` is used on line {node.lineno} but never defined. Where should its value come from?",
+                "line": node.lineno,
+            })
+    return sorted(findings, key=lambda f: f["line"])
+
+
+_TERMINATORS = (ast.Return, ast.Raise, ast.Break, ast.Continue)
+
+
+def _unreachable(tree: ast.AST) -> list[dict]:
+    findings = []
+    for node in ast.walk(tree):
+        for name in ("body", "orelse", "finalbody"):
+            block = getattr(node, name, None)
+            if not isinstance(block, list):
+                continue
+            for stmt, following in zip(block, block[1:]):
+                if isinstance(stmt, _TERMINATORS):
+                    keyword = type(stmt).__name__.lower()
+                    findings.append({
+                        "type": "hint",
+                        "message": (f"Line {following.lineno} comes right after a `{keyword}` on line {stmt.lineno}. "
+                                    "Will Python ever get to run it?"),
+                        "line": following.lineno,
+                    })
+                    break
+    return findings
+
+
+def _exits_loop(body: list[ast.stmt]) -> bool:
+    """Whether a loop body can leave the loop (break/return/raise/exit) or hand control back (yield)."""
+
+    def walk(nodes, nested_loop: bool) -> bool:
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            if isinstance(node, (ast.Return, ast.Raise, ast.Yield, ast.YieldFrom)):
+                return True
+            # A break inside a nested loop only leaves that loop
+            if isinstance(node, ast.Break) and not nested_loop:
+                return True
+            if isinstance(node, ast.Call):
+                func = node.func
+                if (func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", "")) in ("exit", "quit", "_exit"):
+                    return True
+            if walk(ast.iter_child_nodes(node), nested_loop or isinstance(node, (ast.For, ast.AsyncFor, ast.While))):
+                return True
+        return False
+
+    return walk(body, False)
+
+
+def _infinite_loops(tree: ast.AST) -> list[dict]:
+    findings = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.While) and isinstance(node.test, ast.Constant) and node.test.value
+                and not _exits_loop(node.body)):
+            findings.append({
+                "type": "question",
+                "message": (f"The loop on line {node.lineno} runs `while True`, and nothing inside it ever leaves the loop. "
+                            "What should make it stop?"),
+                "line": node.lineno,
+            })
+    return findings
+
+
+def analyze(code: str) -> Analysis:
+    """Run the prepass. Non-Python code comes back with no findings."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        if not looks_like_python(code):
+            return Analysis(language="unknown")
+        return Analysis(language="python", findings=[_syntax_finding(e)], hard_error=True)
+    except (ValueError, RecursionError, MemoryError):
+        # Nested too deeply for the parser: leave it to the model
+        return Analysis(language="unknown")
+    if all(isinstance(stmt, ast.Expr) for stmt in tree.body) and not looks_like_python(code):
+        # Parses as Python only by accident (a bare expression, pseudo-code...)
+        return Analysis(language="unknown")
+    try:
+        findings = _undefined_names(tree) + _unreachable(tree) + _infinite_loops(tree)
+    except RecursionError:
+        return Analysis(language="unknown")
+    return Analysis(language="python", findings=sorted(findings, key=lambda f: f["line"]))
+
+
+def format_findings(findings: list[dict]) -> str:
+    """Findings as prompt context for the model."""
+    return "\n".join(f"- line {f['line']} ({f['type']}): {f['message']}" for f in findings)
@@ -0,0 +1,166 @@
+"""
+Streaming helpers for the SSE transport
+Coalesces many tiny text chunks into fewer frames without delaying the first token,
+carries structured phase payloads beside the prose, and tracks in-flight generations so
+they can be cancelled
+"""
+
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Union
+import asyncio
+import json
+
+
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class PhaseEvent:
+    """A structured payload (level picker, diagnostic, review card) sent as its own event
+    instead of inside the text. `data` is the compact JSON, serialized once."""
+    phase: str
+    data: str
+
+    @classmethod
+    def of(cls, payload: dict) -> "PhaseEvent":
+        return cls(payload["phase"], json.dumps(payload, separators=(",", ":")))
+
+
+class GenerationHandle:
+    """Cancellation flag for one in-flight generation."""
+
+    def __init__(self, keys: tuple):
+        self.keys = keys
+        self.cancelled = asyncio.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str):
+        if not self.cancelled.is_set():
+            self.reason = reason
+            self.cancelled.set()
+
+
+class GenerationRegistry:
+    """In-flight generations addressable by request id or session id."""
+
+    def __init__(self):
+        self._active: dict[str, GenerationHandle] = {}
+
+    def start(self, *keys: Optional[str]) -> GenerationHandle:
+        """Register a generation; any earlier one under the same key is superseded."""
+        keys = tuple(k for k in keys if k)
+        for key in keys:
+            previous = self._active.get(key)
+            if previous is not None:
+                previous.cancel("superseded")
+        handle = GenerationHandle(keys)
+        for key in keys:
+            self._active[key] = handle
+        return handle
+
+    def finish(self, handle: GenerationHandle):
+        for key in handle.keys:
+            if self._active.get(key) is handle:
+                del self._active[key]
+
+    def cancel(self, key: str, reason: str = "requested") -> bool:
+        handle = self._active.get(key)
+        if handle is None:
+            return False
+        handle.cancel(reason)
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._active
+
+    def __len__(self) -> int:
+        return len({id(h) for h in self._active.values()})
+
+
+async def coalesce(source: AsyncIterator[Union[str, PhaseEvent]], max_bytes: int = 256, max_delay: float = 0.03,
+                   cancelled: asyncio.Event = None) -> AsyncIterator[Union[str, PhaseEvent]]:
+    """Re-chunk a text stream, flushing on a size or time threshold.
+
+    The first chunk is passed through immediately so time-to-first-token is unchanged.
+    After that, chunks are buffered until `max_bytes` characters have accumulated or
+    `max_delay` seconds have passed since the oldest buffered chunk, whichever comes
+    first. With both thresholds <= 0 every chunk is flushed as it arrives. Phase events
+    flush the buffered text and pass through on their own, in order.
+
+    If `cancelled` is set, the stream stops and the source is closed, which aborts the
+    underlying model call.
+    """
+    if max_bytes <= 0 and max_delay <= 0:
+        max_bytes = 1
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in source:
+                await queue.put(chunk)
+            await queue.put(_DONE)
+        except Exception as e:
+            await queue.put(e)
+
+    # The source runs in its own task so a stalled upstream can't hold back a timed flush
+    producer = asyncio.create_task(pump())
+    cancel_waiter = asyncio.ensure_future(cancelled.wait()) if cancelled is not None else None
+    getter = None
+    buffer: list[str] = []
+    size = 0
+    deadline = 0.0
+    first = True
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            timed = bool(buffer) and max_delay > 0
+            if timed or cancel_waiter is not None:
+                waiters = {getter} if cancel_waiter is None else {getter, cancel_waiter}
+                timeout = max(0.0, deadline - loop.time()) if timed else None
+                done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if cancel_waiter is not None and cancel_waiter in done:
+                    return
+                if not done:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                    continue
+            item = await getter
+            getter = None
+
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                raise item
+            if isinstance(item, PhaseEvent):
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                yield item
+                continue
+            if first:
+                first = False
+                yield item
+                continue
+
+            if not buffer:
+                deadline = loop.time() + max_delay
+            buffer.append(item)
+            size += len(item)
+            if max_bytes > 0 and size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if getter is not None:
+            getter.cancel()
+        if cancel_waiter is not None:
+            cancel_waiter.cancel()
+        producer.cancel()
@@ -0,0 +1,138 @@
+"""
+Model warm-up and keep-alive for Cortana
+Preloads the model on every Ollama backend, primes the system-prompt prefix, and keeps
+the model resident during business hours so learners never pay the cold-load cost.
+"""
+
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+import time
+
+import httpx
+
+from backends import Backend, BackendPool
+
+
+logger = logging.getLogger("cortana.warmup")
+
+
+def parse_hours(spec: Optional[str]) -> Optional[tuple[int, int]]:
+    """'8-18' -> (8, 18). Empty/'always' -> None (keep alive around the clock)."""
+    if not spec or spec.strip().lower() == "always":
+        return None
+    start, end = spec.split("-", 1)
+    return int(start), int(end)
+
+
+class ModelWarmer:
+    """Warm-up on startup plus a periodic keep-alive ping per backend."""
+
+    def __init__(self, pool: BackendPool, model_name: str, system_prompt: str,
+                 keep_alive: str = "10m", interval: float = 240.0,
+                 business_hours: Optional[tuple[int, int]] = (8, 18), timeout: float = 300.0):
+        self.pool = pool
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.business_hours = business_hours
+        self.timeout = timeout
+        self.warm: dict[str, float] = {}
+        self.warmup_seconds: dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """At least one backend has the model loaded and the system prompt primed."""
+        return bool(self.warm)
+
+    def in_business_hours(self, now: datetime = None) -> bool:
+        if self.business_hours is None:
+            return True
+        start, end = self.business_hours
+        hour = (now or datetime.now()).hour
+        return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+    async def warm_backend(self, backend: Backend, client: httpx.AsyncClient) -> bool:
+        """Load the model and evaluate the system prompt so its prefix is cached."""
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"{backend.url}/api/chat", json={
+                "model": self.model_name,
+                "messages": [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": "Hi"},
+                ],
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": {"num_predict": 1},
+            }, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            self.warm.pop(backend.url, None)
+            logger.warning("Warm-up failed for %s: %s", backend.url, e)
+            return False
+        self.warm[backend.url] = time.time()
+        self.warmup_seconds[backend.url] = time.perf_counter() - start
+        logger.info("Warmed %s on %s in %.1fs", self.model_name, backend.url, self.warmup_seconds[backend.url])
+        return True
+
+    async def keep_alive_backend(self, backend: Backend, client: httpx.AsyncClient):
+        """Refresh the model's residency without generating anything."""
+        try:
+            response = await client.post(f"{backend.url}/api/generate", json={
+                "model": self.model_name,
+                "keep_alive": self.keep_alive,
+            }, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            self.warm.pop(backend.url, None)
+            logger.warning("Keep-alive failed for %s: %s", backend.url, e)
+
+    async def warm_all(self):
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*(self.warm_backend(b, client) for b in self.pool.backends))
+
+    async def _run(self):
+        retry = 2.0
+        while not self.ready:
+            await self.warm_all()
+            if not self.ready:
+                await asyncio.sleep(retry)
+                retry = min(retry * 2, 60.0)
+        async with httpx.AsyncClient() as client:
+            while True:
+                await asyncio.sleep(self.interval)
+                if not self.in_business_hours():
+                    continue
+                for backend in self.pool.backends:
+                    # Backends that dropped out (or never warmed) get a full warm-up again
+                    if backend.url in self.warm:
+                        await self.keep_alive_backend(backend, client)
+                    elif backend.healthy:
+                        await self.warm_backend(backend, client)
+
+    def start(self):
+        """Warm up in the background (call from a running event loop)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "warm_backends": sorted(self.warm),
+            "warmup_seconds": {url: round(s, 2) for url, s in self.warmup_seconds.items()},
+            "keep_alive": self.keep_alive,
+            "business_hours": self.business_hours,
+        }
@@ -1,15 +1,16 @@
-import { useState, useCallback } from 'react';
+import { useState, useCallback, useRef } from 'react';
 import Sidebar from './components/Sidebar';
 import ChatWindow from './components/ChatWindow';
 import MessageInput from './components/MessageInput';
 import CodePlayground from './components/CodePlayground';
-import { sendMessageStream, reviewCode } from './api';
+import { sendMessageStream, reviewCode, createSession, ChatSocket } from './api';
 
 function App() {
   const [conversations, setConversations] = useState([]);
   const [activeConversationId, setActiveConversationId] = useState(null);
   const [messages, setMessages] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [sessionId, setSessionId] = useState(null);
 
   // Session state for Socratic teaching
   const [userLevel, setUserLevel] = useState(null);
@@ -17,6 +18,27 @@ function App() {
   const [showPlayground, setShowPlayground] = useState(false);
   const [codeFeedback, setCodeFeedback] = useState([]);
 
+  // WebSocket for the active conversation (null: not connected yet, or fell back to HTTP)
+  const socketRef = useRef(null);
+
+  const resetSocket = useCallback(() => {
+    socketRef.current?.close();
+    socketRef.current = null;
+  }, []);
+
+  const connectSocket = useCallback(async (currentSessionId) => {
+    if (socketRef.current) return socketRef.current;
+    const socket = new ChatSocket(currentSessionId);
+    try {
+      await socket.connect();
+    } catch (error) {
+      if (error.sessionExpired) throw error;
+      return null;
+    }
+    socketRef.current = socket;
+    return socket;
+  }, []);
+
   const handleNewChat = useCallback(() => {
     const newConv = {
       id: Date.now(),
@@ -26,17 +48,21 @@ function App() {
     setConversations(prev => [newConv, ...prev]);
     setActiveConversationId(newConv.id);
     setMessages([]);
+    setSessionId(null);
+    resetSocket();
     setUserLevel(null);
     setCurrentStep(0);
     setShowPlayground(false);
     setCodeFeedback([]);
-  }, []);
+  }, [resetSocket]);
 
   const handleSelectConversation = useCallback((id) => {
     setActiveConversationId(id);
     const conv = conversations.find(c => c.id === id);
     setMessages(conv?.messages || []);
-  }, [conversations]);
+    setSessionId(conv?.sessionId || null);
+    resetSocket();
+  }, [conversations, resetSocket]);
 
   const handleLevelSelect = useCallback((level) => {
     setUserLevel(level);
@@ -47,7 +73,22 @@ function App() {
   const handleCodeSubmit = useCallback(async (code) => {
     setIsLoading(true);
     try {
-      const result = await reviewCode(code, 'User code submission', userLevel || 'beginner');
+      // Over the socket, hints appear in the playground as soon as each one is ready
+      const socket = socketRef.current;
+      const result = socket
+        ? await new Promise((resolve) => {
+          const streamed = [];
+          setCodeFeedback([]);
+          socket.review(code, 'User code submission', userLevel || 'beginner', {
+            onFeedback: (item) => {
+              streamed.push(item);
+              setCodeFeedback([...streamed]);
+            },
+            onComplete: (frame) => resolve({ feedback: frame.feedback || streamed }),
+            onError: (error) => resolve({ feedback: [...streamed, { type: 'error', message: `Review failed: ${error}` }] }),
+          });
+        })
+        : await reviewCode(code, 'User code submission', userLevel || 'beginner');
       setCodeFeedback(result.feedback || []);
 
       // Add code review to chat
@@ -77,6 +118,27 @@ function App() {
       setActiveConversationId(currentConvId);
     }
 
+    // Prefer the WebSocket (it creates or resumes the session); plain HTTP otherwise, and for
+    // conversations that only exist client-side
+    let currentSessionId = sessionId;
+    let socket = null;
+    if (currentSessionId || messages.length === 0) {
+      try {
+        socket = await connectSocket(currentSessionId);
+      } catch (error) {
+        // The server lost this session: carry on over HTTP, which sends the whole transcript
+        currentSessionId = null;
+        setSessionId(null);
+      }
+    }
+    if (socket) {
+      currentSessionId = socket.sessionId;
+      setSessionId(currentSessionId);
+    } else if (!currentSessionId && messages.length === 0) {
+      currentSessionId = await createSession(userLevel);
+      setSessionId(currentSessionId);
+    }
+
     const userMessage = { role: 'user', content };
     const newMessages = [...messages, userMessage];
     setMessages(newMessages);
@@ -93,54 +155,71 @@ function App() {
 
     setIsLoading(true);
     let assistantContent = '';
+    let assistantPhase = null;
 
-    try {
-      await sendMessageStream(
-        content,
-        messages,
-        userLevel,
-        (chunk) => {
-          assistantContent += chunk;
-
-          // Check for playground trigger
-          if (assistantContent.includes('show_playground": true') ||
-            assistantContent.includes('[NEAR-SOLUTION]') ||
-            assistantContent.includes('[NEAR_SOLUTION]')) {
-            setShowPlayground(true);
-          }
-
-          setMessages(prev => {
-            const updated = [...prev];
-            const lastIdx = updated.length - 1;
-            if (updated[lastIdx]?.role === 'assistant') {
-              updated[lastIdx] = { ...updated[lastIdx], content: assistantContent };
-            } else {
-              updated.push({ role: 'assistant', content: assistantContent });
-            }
-            return updated;
-          });
-        },
-        () => {
-          setIsLoading(false);
-          setCurrentStep(prev => prev + 1);
-          setConversations(prev =>
-            prev.map(c =>
-              c.id === currentConvId
-                ? { ...c, messages: [...newMessages, { role: 'assistant', content: assistantContent }] }
-                : c
-            )
-          );
-        },
-        (error) => {
-          setIsLoading(false);
-          setMessages(prev => [...prev, { role: 'assistant', content: `Error: ${error}` }]);
+    const showAssistant = () => {
+      setMessages(prev => {
+        const updated = [...prev];
+        const lastIdx = updated.length - 1;
+        if (updated[lastIdx]?.role === 'assistant') {
+          updated[lastIdx] = { ...updated[lastIdx], content: assistantContent, phase: assistantPhase };
+        } else {
+          updated.push({ role: 'assistant', content: assistantContent, phase: assistantPhase });
         }
+        return updated;
+      });
+    };
+    const onChunk = (chunk) => {
+      assistantContent += chunk;
+
+      // Check for playground trigger (only the new text, plus enough overlap for a split marker)
+      const recent = assistantContent.slice(-(chunk.length + 16));
+      if (recent.includes('[NEAR-SOLUTION]') || recent.includes('[NEAR_SOLUTION]')) {
+        setShowPlayground(true);
+      }
+      showAssistant();
+    };
+    const onPhase = (phase) => {
+      assistantPhase = phase;
+      if (phase.show_playground || phase.phase === 'NEAR_SOLUTION') {
+        setShowPlayground(true);
+      }
+      showAssistant();
+    };
+    const onComplete = () => {
+      setIsLoading(false);
+      setCurrentStep(prev => prev + 1);
+      setConversations(prev =>
+        prev.map(c =>
+          c.id === currentConvId
+            ? { ...c, sessionId: currentSessionId, messages: [...newMessages, { role: 'assistant', content: assistantContent, phase: assistantPhase }] }
+            : c
+        )
       );
+    };
+    const onError = (error) => {
+      setIsLoading(false);
+      setMessages(prev => [...prev, { role: 'assistant', content: `Error: ${error}` }]);
+    };
+
+    try {
+      if (socket) {
+        await new Promise((resolve) => {
+          socket.chat(content, userLevel, {
+            onChunk,
+            onPhase,
+            onComplete: () => { onComplete(); resolve(); },
+            onError: (error) => { onError(error); resolve(); },
+          });
+        });
+      } else {
+        await sendMessageStream(content, messages, userLevel, onChunk, onComplete, onError, currentSessionId, onPhase);
+      }
     } catch (error) {
       setIsLoading(false);
       setMessages(prev => [...prev, { role: 'assistant', content: `Error: ${error.message}` }]);
     }
-  }, [messages, isLoading, activeConversationId, userLevel]);
+  }, [messages, isLoading, activeConversationId, userLevel, sessionId, connectSocket]);
 
   return (
     <div className="flex h-screen bg-[#212121]">
@@ -5,25 +5,59 @@
 const API_BASE = 'http://localhost:8000';
 
 /**
- * Send message with streaming and level context
+ * Create a server-side session so later turns only send the new message
  */
-export async function sendMessageStream(message, history = [], userLevel = null, onChunk, onComplete, onError) {
+export async function createSession(userLevel = null) {
   try {
-    const response = await fetch(`${API_BASE}/chat`, {
+    const response = await fetch(`${API_BASE}/sessions`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({
-        message,
-        history: history.map(msg => ({
-          role: msg.role,
-          content: msg.content
-        })),
-        stream: true,
-        user_level: userLevel
-      }),
+      body: JSON.stringify({ user_level: userLevel }),
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const data = await response.json();
+    return data.session_id;
+  } catch (error) {
+    // Fall back to sending the full history
+    return null;
+  }
+}
+
+/**
+ * Send message with streaming and level context. Structured payloads (level picker,
+ * diagnostic, review card) arrive as separate `phase` events and go to onPhase.
+ */
+export async function sendMessageStream(message, history = [], userLevel = null, onChunk, onComplete, onError, sessionId = null, onPhase = null) {
+  try {
+    const postChat = (body) => fetch(`${API_BASE}/chat`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
     });
+    const fullHistoryBody = {
+      message,
+      history: history.map(msg => ({
+        role: msg.role,
+        content: msg.content
+      })),
+      stream: true,
+      user_level: userLevel
+    };
+
+    let response = sessionId
+      ? await postChat({ message, session_id: sessionId, stream: true, user_level: userLevel })
+      : await postChat(fullHistoryBody);
+
+    // Session expired server-side: resend the transcript instead
+    if (sessionId && response.status === 404) {
+      response = await postChat(fullHistoryBody);
+    }
 
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
@@ -31,22 +65,34 @@ export async function sendMessageStream(message, history = [], userLevel = null,
 
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
+    let eventType = 'message';
+    // Reads can end mid-line (large phase payloads often do): keep the tail for the next one
+    let buffered = '';
 
     while (true) {
       const { done, value } = await reader.read();
       if (done) break;
 
-      const text = decoder.decode(value);
-      const lines = text.split('\n');
+      buffered += decoder.decode(value, { stream: true });
+      const lines = buffered.split('\n');
+      buffered = lines.pop();
 
       for (const line of lines) {
-        if (line.startsWith('data: ')) {
+        if (line.startsWith('event: ')) {
+          eventType = line.slice(7).trim();
+        } else if (line === '') {
+          eventType = 'message';
+        } else if (line.startsWith('data: ')) {
           try {
             const data = JSON.parse(line.slice(6));
+            if (eventType === 'phase') {
+              onPhase?.(data);
+              continue;
+            }
             if (data.content) {
               onChunk(data.content);
             }
-            if (data.done) {
+            if (data.done || data.cancelled) {
               onComplete();
               return;
             }
@@ -67,6 +113,112 @@ export async function sendMessageStream(message, history = [], userLevel = null,
   }
 }
 
+/**
+ * One WebSocket per learner, bound to a server-side session. Turns send only the new
+ * message, run concurrently under their own ids and can be cancelled in-band.
+ */
+export class ChatSocket {
+  constructor(sessionId = null) {
+    this.sessionId = sessionId;
+    this.userLevel = null;
+    this.socket = null;
+    this.turns = new Map();
+    this.nextId = 0;
+  }
+
+  /** Open the socket; resolves once the server has bound it to a session. */
+  connect() {
+    if (this.ready) return this.ready;
+    const url = new URL('/ws/chat', API_BASE.replace(/^http/, 'ws'));
+    if (this.sessionId) url.searchParams.set('session_id', this.sessionId);
+    this.ready = new Promise((resolve, reject) => {
+      const socket = new WebSocket(url);
+      socket.onmessage = (event) => {
+        let frame;
+        try {
+          frame = JSON.parse(event.data);
+        } catch (e) {
+          return;
+        }
+        if (frame.type === 'session') {
+          this.sessionId = frame.session_id;
+          this.userLevel = frame.user_level;
+          resolve(this);
+          return;
+        }
+        this.dispatch(frame);
+      };
+      socket.onerror = () => reject(new Error('WebSocket connection failed'));
+      socket.onclose = (event) => {
+        this.ready = null;
+        this.socket = null;
+        for (const handlers of this.turns.values()) {
+          handlers.onError?.('Connection closed');
+        }
+        this.turns.clear();
+        // 4404: the session to resume is gone (expired, or never existed on this server)
+        const error = new Error(event.code === 4404 ? 'Session not found or expired' : 'WebSocket closed');
+        error.sessionExpired = event.code === 4404;
+        reject(error);
+      };
+      this.socket = socket;
+    });
+    return this.ready;
+  }
+
+  dispatch(frame) {
+    const handlers = this.turns.get(frame.id);
+    if (!handlers) return;
+    switch (frame.type) {
+      case 'token':
+        handlers.onChunk?.(frame.content);
+        break;
+      case 'phase':
+        handlers.onPhase?.(frame.data);
+        break;
+      case 'feedback':
+        handlers.onFeedback?.(frame.item);
+        break;
+      case 'done':
+      case 'cancelled':
+        this.turns.delete(frame.id);
+        handlers.onComplete?.(frame);
+        break;
+      case 'error':
+        this.turns.delete(frame.id);
+        handlers.onError?.(frame.error);
+        break;
+      default:
+        handlers.onEvent?.(frame);
+    }
+  }
+
+  /** Start a turn; returns its id (for cancel). */
+  async send(type, payload, handlers) {
+    await this.connect();
+    const id = `${type}-${++this.nextId}`;
+    this.turns.set(id, handlers);
+    this.socket.send(JSON.stringify({ type, id, ...payload }));
+    return id;
+  }
+
+  chat(message, userLevel, handlers) {
+    return this.send('chat', { message, user_level: userLevel }, handlers);
+  }
+
+  review(code, context, userLevel, handlers) {
+    return this.send('review', { code, context, user_level: userLevel }, handlers);
+  }
+
+  cancel(id) {
+    this.socket?.send(JSON.stringify({ type: 'cancel', id }));
+  }
+
+  close() {
+    this.socket?.close();
+  }
+}
+
 /**
  * Submit code for review
  */
@@ -10,23 +10,6 @@ export default function ChatWindow({ messages, isLoading, onLevelSelect, userLev
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
-  // Parse structured JSON from message content
-  const parseStructuredContent = (content) => {
-    if (content.includes('<!--JSON_START-->')) {
-      try {
-        const jsonMatch = content.match(/<!--JSON_START-->\n([\s\S]*?)\n<!--JSON_END-->/);
-        if (jsonMatch) {
-          const jsonData = JSON.parse(jsonMatch[1]);
-          const textContent = content.replace(/<!--JSON_START-->[\s\S]*?<!--JSON_END-->\n\n/, '');
-          return { json: jsonData, text: textContent };
-        }
-      } catch (e) {
-        // Fall back to text
-      }
-    }
-    return { json: null, text: content };
-  };
-
   // Render level selection phase
   const renderLevelSelect = (data) => (
     <div className="level-select-container">
@@ -139,9 +122,8 @@ export default function ChatWindow({ messages, isLoading, onLevelSelect, userLev
     <div className="chat-area">
       <div className="chat-messages">
         {messages.map((msg, idx) => {
-          const { json, text } = msg.role === 'assistant'
-            ? parseStructuredContent(msg.content)
-            : { json: null, text: msg.content };
+          // Structured payloads arrive as their own stream event, already parsed
+          const json = msg.role === 'assistant' ? msg.phase : null;
 
           return (
             <div key={idx} className="message">
@@ -159,7 +141,7 @@ export default function ChatWindow({ messages, isLoading, onLevelSelect, userLev
                   {json?.phase === 'QUIZ' && renderQuiz(json)}
                   {json?.phase === 'CODE_REVIEW' && renderCodeReview(json)}
                   {json?.phase === 'TEXT_DIAGNOSTIC_RESULT' && renderTextDiagnosticResult(json)}
-                  <ReactMarkdown>{text}</ReactMarkdown>
+                  <ReactMarkdown>{msg.content}</ReactMarkdown>
                 </div>
               </div>
             </div>